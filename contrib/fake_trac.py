@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+    fake_trac.py
+    ~~~~~~~~~~~~
+
+    a local XML-RPC server that implements the subset of the Trac XML-RPC
+    interface used by the tinderbox (ticket.query, ticket.create,
+    ticket.update, ticket.putAttachment and system.multicall), keeping the
+    tickets in memory. Used to test the tinderbox without a real Trac::
+
+        $ ./fake_trac.py --port 8000
+        # ./tinderbox.py --trac-url http://localhost:8000/
+
+    :copyright: (c) 2010 by Rafael Goncalves Martins
+    :license: GPL-2, see LICENSE for more details.
+"""
+
+from __future__ import print_function
+
+import optparse
+import sys
+import threading
+
+try:
+    from SimpleXMLRPCServer import SimpleXMLRPCServer
+    import xmlrpclib
+except ImportError:
+    from xmlrpc.server import SimpleXMLRPCServer
+    import xmlrpc.client as xmlrpclib
+
+
+class FakeTrac:
+
+    def __init__(self):
+        # id -> dict with the keys 'summary', 'description', 'attributes',
+        # 'comments' and 'attachments' (filename -> content)
+        self.tickets = {}
+
+    def query(self, qstr):
+        # only the queries used by the tinderbox: 'summary=~text'
+        if not qstr.startswith('summary=~'):
+            raise xmlrpclib.Fault(1, 'Unsupported query: %s' % qstr)
+        text = qstr[len('summary=~'):]
+        return sorted([i for i in self.tickets if text in self.tickets[i]['summary']])
+
+    def create(self, summary, description, attributes={}, notify=False):
+        ticket_id = len(self.tickets) + 1
+        self.tickets[ticket_id] = dict(
+            summary = summary,
+            description = description,
+            attributes = attributes,
+            comments = [],
+            attachments = {},
+        )
+        return ticket_id
+
+    def _get(self, ticket_id):
+        if ticket_id not in self.tickets:
+            raise xmlrpclib.Fault(2, 'Ticket not found: %s' % ticket_id)
+        return self.tickets[ticket_id]
+
+    def update(self, ticket_id, comment, attributes={}, notify=False):
+        self._get(ticket_id)['comments'].append(comment)
+        return [ticket_id]
+
+    def putAttachment(self, ticket_id, filename, description, data, replace=True):
+        attachments = self._get(ticket_id)['attachments']
+        # like Trac, the attachments with the same name are renamed
+        name, i = filename, 1
+        while name in attachments and not replace:
+            i += 1
+            name = '%s.%i' % (filename, i)
+        attachments[name] = data.data
+        return name
+
+
+class FakeTracServer(SimpleXMLRPCServer):
+
+    def __init__(self, addr=('127.0.0.1', 0)):
+        SimpleXMLRPCServer.__init__(self, addr, logRequests=False, allow_none=True)
+        self.trac = FakeTrac()
+        # number of HTTP requests answered
+        self.requests = 0
+        # number of requests to fail (with an HTTP error) before answering
+        self.failures = 0
+        # number of requests creating tickets to answer with an HTTP error,
+        # after the tickets are created (the response is lost)
+        self.lost_creates = 0
+        self.register_multicall_functions()
+        for method in ['query', 'create', 'update', 'putAttachment']:
+            self.register_function(getattr(self.trac, method), 'ticket.' + method)
+
+    @property
+    def url(self):
+        return 'http://%s:%i/' % self.server_address
+
+    def _marshaled_dispatch(self, data, *args, **kwargs):
+        self.requests += 1
+        if self.failures > 0:
+            self.failures -= 1
+            raise Exception('Fake failure')
+        response = SimpleXMLRPCServer._marshaled_dispatch(self, data, *args, **kwargs)
+        if self.lost_creates > 0 and b'ticket.create' in data:
+            self.lost_creates -= 1
+            raise Exception('Fake lost response')
+        return response
+
+    def start(self):
+        '''serves the requests from a background thread.'''
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+
+def main(argv):
+    parser = optparse.OptionParser()
+    parser.add_option(
+        '-p', '--port',
+        type = 'int',
+        dest = 'port',
+        default = 8000,
+        help = 'port to listen.'
+    )
+    options, args = parser.parse_args(argv[1:])
+    server = FakeTracServer(('127.0.0.1', options.port))
+    print('Fake Trac listening: %s' % server.url)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
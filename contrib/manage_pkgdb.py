@@ -15,18 +15,22 @@ from __future__ import print_function
 
 import datetime
 import feedparser
+import httplib
 import json
 import optparse
 import os
 import re
 import shutil
+import socket
 import subprocess
 import sys
 import tarfile
+import threading
 import time
-import urllib
+import urlparse
 
 from contextlib import closing
+from Queue import Queue
 
 current_dir = os.path.dirname(os.path.realpath(__file__))
 if os.path.exists(os.path.join(current_dir, '..', 'g_octave')):
@@ -48,6 +52,43 @@ class Git:
 
 re_tarball = re.compile(r'(([^/]+)-([0-9.]+)\.tar\.gz)$')
 
+class ConnectionPool:
+
+    # keeps an HTTP(S) connection per thread and server, reused by all the
+    # requests of the thread.
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def _connection(self, scheme, netloc):
+        connections = self._local.__dict__.setdefault('connections', {})
+        if (scheme, netloc) not in connections:
+            if scheme == 'https':
+                connections[(scheme, netloc)] = httplib.HTTPSConnection(netloc, timeout=60)
+            else:
+                connections[(scheme, netloc)] = httplib.HTTPConnection(netloc, timeout=60)
+        return connections[(scheme, netloc)]
+
+    def head(self, url):
+        # returns the HTTP status code of a HEAD request to the url
+        url = urlparse.urlsplit(url)
+        path = url.path
+        if url.query:
+            path += '?' + url.query
+        for retry in [True, False]:
+            conn = self._connection(url.scheme, url.netloc)
+            try:
+                conn.request('HEAD', path)
+                response = conn.getresponse()
+                response.read()
+                return response.status
+            except (httplib.HTTPException, socket.error):
+                # the server closed the connection, try again with a new one
+                conn.close()
+                del self._local.connections[(url.scheme, url.netloc)]
+                if not retry:
+                    raise
+
 class SfUpdates:
 
     # feed url from 'http://sourceforge.net/projects/octave/files/Octave%20Forge%20Packages/Individual%20Package%20Releases/'
@@ -73,24 +114,46 @@ class SfUpdates:
             raise self.feed.bozo_exception
         self.entries = self.feed.entries
         self._db = description_tree.DescriptionTree()
-
-    def _compute_manifest(self, db_dir):
-        manifest = {}
-        packages = self._db.list()
-        for category in packages.iterkeys():
-            for pkg in packages[category].iterkeys():
-                for version in packages[category][pkg]:
-                    description = os.path.join(
-                        db_dir,
-                        'octave-forge',
-                        str(category),
-                        pkg,
-                        '%s-%s.DESCRIPTION' % (pkg, version)
-                    )
-                    manifest[pkg + '-' + version] = sha1_compute(description)
+        self._pool = ConnectionPool()
+
+    def _descriptions(self, db_dir):
+        # P: path of the DESCRIPTION file, for all the files of the package
+        # database. Only lists the directories, nothing is read.
+        descriptions = {}
+        octave_forge = os.path.join(db_dir, 'octave-forge')
+        for root, dirs, files in os.walk(octave_forge):
+            for filename in files:
+                if filename.endswith('.DESCRIPTION'):
+                    descriptions[filename[:-len('.DESCRIPTION')]] = \
+                        os.path.join(root, filename)
+        return descriptions
+
+    def _update_manifest(self, db_dir, written):
+        # written: P: path of the DESCRIPTION files written by this run.
+        # Only these files, the files modified since the current manifest
+        # was written (e.g. by hand, or by an interrupted run) and the files
+        # missing from it are hashed.
+        manifest_file = os.path.join(self._repo_dir, 'manifest.json')
         try:
-            with open(os.path.join(self._repo_dir, 'manifest.json'), 'w') as fp:
+            manifest_mtime = os.stat(manifest_file).st_mtime
+            with open(manifest_file) as fp:
+                manifest = json.load(fp)
+        except:
+            manifest_mtime = 0
+            manifest = {}
+        descriptions = self._descriptions(db_dir)
+        for p in list(manifest.keys()):
+            if p not in descriptions:
+                del manifest[p]
+        for p in descriptions:
+            # '>=': the mtime resolution may be as coarse as one second
+            if p in written or p not in manifest or \
+               os.stat(descriptions[p]).st_mtime >= manifest_mtime:
+                manifest[p] = sha1_compute(descriptions[p])
+        try:
+            with open(manifest_file + '.tmp', 'w') as fp:
                 json.dump(manifest, fp, indent=2, sort_keys=True)
+            os.rename(manifest_file + '.tmp', manifest_file)
         except:
             pass
 
@@ -151,45 +214,108 @@ class SfUpdates:
                     }
         return entries
 
+    def _load_categories(self):
+        # persistent cache of the guessed categories: name -> category
+        try:
+            with open(os.path.join(self._local_dir, 'categories.json')) as fp:
+                return json.load(fp)
+        except (IOError, OSError, ValueError):
+            return {}
+
+    def _save_categories(self, categories):
+        categories_file = os.path.join(self._local_dir, 'categories.json')
+        try:
+            with open(categories_file + '.tmp', 'w') as fp:
+                json.dump(categories, fp, indent=2, sort_keys=True)
+            os.rename(categories_file + '.tmp', categories_file)
+        except (IOError, OSError, ValueError):
+            pass
+
     def guess_category(self, pkgname):
         if pkgname in self.pre_guessed_pkgs:
             return self.pre_guessed_pkgs[pkgname]
         for category in self.categories:
-            f = urllib.urlopen(self.svnroot_url + '/' + category + '/' + pkgname + '/DESCRIPTION')
-            if f.getcode() == 200:
+            if self._pool.head(self.svnroot_url + '/' + category + '/' + pkgname + '/DESCRIPTION') == 200:
                 return category
 
-    def check_updates(self):
+    def find_category(self, pkgname, local_categories, categories):
+        # the local package database and the cache are checked before
+        # asking to the SVN repository.
+        if pkgname in self.pre_guessed_pkgs:
+            return self.pre_guessed_pkgs[pkgname]
+        category = local_categories.get(pkgname.lower())
+        if category is None:
+            category = categories.get(pkgname)
+        if category is None:
+            category = self.guess_category(pkgname)
+            if category is not None:
+                categories[pkgname] = category
+        return category
+
+    def check_updates(self, jobs=8):
         local_files = self.local_files()
         remote_files = self.remote_files()
-        updates = {}
+        local_categories = dict([(i['name'].lower(), i['category']) \
+            for i in local_files.itervalues()])
+        categories = self._load_categories()
+
+        # the categories are found and the tarballs downloaded by a pool of
+        # threads, one update per thread at a time.
+        tasks, results = Queue(), Queue()
+        def worker():
+            while True:
+                remote = tasks.get()
+                if remote is None:
+                    return
+                entry = remote_files[remote]
+                try:
+                    entry['category'] = self.find_category(entry['name'],
+                        local_categories, categories)
+                    return_code = self.download(remote, entry)
+                except Exception as exc:
+                    print('%s: %s' % (remote, exc), file=sys.stderr)
+                    return_code = os.EX_SOFTWARE
+                results.put((remote, return_code))
+        workers = []
+        # with no workers, the queue below would never be consumed
+        for i in range(min(max(1, jobs), len(remote_files))):
+            thread = threading.Thread(target=worker)
+            thread.daemon = True
+            thread.start()
+            workers.append(thread)
         for remote in remote_files:
-            print('update found: %s; ' % remote, end='')
-            sys.stdout.flush()
+            tasks.put(remote)
+        for thread in workers:
+            tasks.put(None)
+
+        updates = {}
+        failures = []
+        for i in range(len(remote_files)):
+            remote, return_code = results.get()
+            print('update found: %s; category: %s' % (remote, remote_files[remote]['category']))
+            if return_code != os.EX_OK:
+                failures.append(remote)
             updates[remote] = remote_files[remote]
-            category = self.guess_category(remote_files[remote]['name'])
-            if category is None:
-                remote_name = remote_files[remote]['name'].lower()
-                for local in local_files:
-                    local_name = local_files[local]['name'].lower()
-                    if remote_name == local_name:
-                        category = local_files[local]['category']
-                        break
-            remote_files[remote]['category'] = category
-            print('category: %s' % category)
-            if self.download(remote, remote_files[remote]) != os.EX_OK:
-                raise RuntimeError('Failed to download: %s' % remote)
+        self._save_categories(categories)
+        if len(failures) > 0:
+            raise RuntimeError('Failed to download: %s' % ', '.join(sorted(failures)))
         return updates
 
     def download(self, tarball_name, entry):
         cat_dir = os.path.join(self._local_dir, str(entry['category']))
         file_path = os.path.join(cat_dir, tarball_name)
         if not os.path.exists(cat_dir):
-            os.makedirs(cat_dir, 0o755)
+            try:
+                os.makedirs(cat_dir, 0o755)
+            except OSError:
+                # created by another thread
+                if not os.path.isdir(cat_dir):
+                    raise
         if not os.path.exists(file_path):
             return subprocess.call([
                 'wget',
                 '--continue',
+                '--no-verbose',
                 '--output-document', file_path,
                 entry['url']
             ])
@@ -198,6 +324,7 @@ class SfUpdates:
     def update_package_database(self, local_files, db_dir):
         if not os.path.exists(db_dir):
             os.makedirs(db_dir)
+        written = {}
         for tarball_name in local_files:
             entry = local_files[tarball_name]
             description = os.path.join(
@@ -221,13 +348,14 @@ class SfUpdates:
                         if f.name.endswith('DESCRIPTION'):
                             to_extract = f
                             break
-                    if f is None:
-                        print('DESCRIPTION file not found: %s', tarball_name, file=sys.stderr)
+                    if to_extract is None:
+                        print('DESCRIPTION file not found: %s' % tarball_name, file=sys.stderr)
                         continue
-                    with closing(src_tar.extractfile(f)) as fp_tar:
+                    with closing(src_tar.extractfile(to_extract)) as fp_tar:
                         with open(description, 'w') as fp:
                             shutil.copyfileobj(fp_tar, fp)
-        self._compute_manifest(db_dir)
+                written['%s-%s' % (entry['name'], entry['version'])] = description
+        self._update_manifest(db_dir, written)
         self._save_timestamp()
 
 
@@ -255,6 +383,14 @@ def main(argv):
         help = 'push the changes to the remote Git repository'
     )
 
+    parser.add_option(
+        '-j', '--jobs',
+        type = 'int',
+        dest = 'jobs',
+        default = 8,
+        help = 'number of updates to download at the same time'
+    )
+
     options, args = parser.parse_args(argv[1:])
 
     if len(args) != 2:
@@ -269,7 +405,7 @@ def main(argv):
     print('* Fetching and parsing the Octave-Forge RSS feed ...')
     sf = SfUpdates(args[0], args[1])
     print('* Looking for updates ...')
-    remote_files = sf.check_updates()
+    remote_files = sf.check_updates(options.jobs)
     print('* Trying to update the package database ...')
     sf.update_package_database(remote_files, args[1])
     if options.commit or options.push:
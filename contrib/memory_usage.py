@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+    memory_usage.py
+    ~~~~~~~~~~~~~~~
+
+    a simple script that measures (with tracemalloc) the memory used by a
+    DescriptionTree loaded from synthetic package databases of the given
+    sizes (number of DESCRIPTION files). Run it from two checkouts to
+    compare the memory usage of different revisions of g-octave.
+
+    :copyright: (c) 2010 by Rafael Goncalves Martins
+    :license: GPL-2, see LICENSE for more details.
+"""
+
+from __future__ import print_function
+
+import gc
+import json
+import os
+import shutil
+import sys
+import tempfile
+import tracemalloc
+
+current_dir = os.path.dirname(os.path.realpath(__file__))
+if os.path.exists(os.path.join(current_dir, '..', 'g_octave')):
+    sys.path.insert(0, os.path.join(current_dir, '..'))
+
+# disabling the logging
+os.environ['GOCTAVE_LOG_LEVEL'] = ''
+
+from g_octave import description_tree
+
+categories = ['main', 'extra', 'language']
+licenses = ['GPL version 3 or later', 'GPL version 2 or later', 'LGPL', 'BSD']
+versions_per_package = 4
+
+description_template = '''\
+Name: %(name)s
+Version: %(version)s
+Date: 2010-%(month)02d-01
+Author: %(name)s Author <author@octave.org>
+Maintainer: %(maintainer)s
+Title: The %(name)s package
+Description: The %(name)s package provides a lot of functions
+ for %(name)s, with some documentation and some demos. This is a
+ long text, like the descriptions of the real packages.
+Categories: %(category)s
+Depends: octave (>= 3.2.0)%(depends)s
+SystemRequirements: pkg1 (>= 4.3.2), pkg2
+BuildRequires: pkg3 (> 1.0.0)
+Autoload: yes
+License: %(license)s
+Url: http://octave.sf.net
+'''
+
+def create_db(db, size):
+    packages = max(size // versions_per_package, 1)
+    for i in range(size):
+        number = i % packages
+        name = 'package%d' % number
+        version = '1.0.%d' % (i // packages)
+        category = categories[number % len(categories)]
+        pkg_dir = os.path.join(db, 'octave-forge', category, name)
+        if not os.path.exists(pkg_dir):
+            os.makedirs(pkg_dir)
+        depends = ''
+        if number > 0:
+            depends = ', package%d (>= 1.0.0)' % (number - 1)
+        content = description_template % dict(
+            name = name,
+            version = version,
+            month = i % 12 + 1,
+            maintainer = 'Maintainer %d <maintainer%d@octave.org>' % (number % 10, number % 10),
+            category = category.capitalize(),
+            depends = depends,
+            license = licenses[number % len(licenses)],
+        )
+        with open(os.path.join(pkg_dir, '%s-%s.DESCRIPTION' % (name, version)), 'w') as fp:
+            fp.write(content)
+    with open(os.path.join(db, 'info.json'), 'w') as fp:
+        json.dump(dict(
+            dependencies = dict(
+                pkg1 = 'sci-libs/pkg1',
+                pkg2 = 'sci-libs/pkg2',
+                pkg3 = 'dev-util/pkg3',
+            ),
+            licenses = {
+                'GPL version 3 or later': 'GPL-3',
+                'GPL version 2 or later': 'GPL-2',
+                'LGPL': 'LGPL-2.1',
+            },
+        ), fp)
+
+def measure(size, top=0):
+    db = tempfile.mkdtemp()
+    try:
+        create_db(db, size)
+        os.environ['GOCTAVE_DB'] = db
+        gc.collect()
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        tree = description_tree.DescriptionTree()
+        gc.collect()
+        current, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+    finally:
+        shutil.rmtree(db)
+    print('%6d DESCRIPTION files: %8.1f KiB (peak %8.1f KiB), %5d bytes per file' % (
+        len(tree), current / 1024.0, peak / 1024.0, current // max(len(tree), 1)
+    ))
+    if top > 0:
+        for stat in after.compare_to(before, 'lineno')[:top]:
+            print('    %s' % stat)
+
+def main(argv):
+    top = 0
+    sizes = []
+    for arg in argv[1:]:
+        if arg.startswith('--top='):
+            top = int(arg[len('--top='):])
+        else:
+            sizes.append(int(arg))
+    if len(sizes) == 0:
+        sizes = [100, 1000, 5000]
+    for size in sizes:
+        measure(size, top)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
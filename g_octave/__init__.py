@@ -12,11 +12,13 @@
 
 __all__ = [
     'config',
+    'database',
     'description',
     'description_tree',
     'exception',
     'ebuild',
     'fetch',
+    'lock',
     'overlay'
 ]
 
@@ -36,7 +36,7 @@ def sha1_check(db, p):
     '''Checks if the SHA1 checksum of the package is OK.'''
     description = db.get(p)
     manifest = {}
-    with open(os.path.join(config.db, 'manifest.json')) as fp:
+    with open(os.path.join(db.db_dir, 'manifest.json')) as fp:
         manifest = json.load(fp)
     if p not in manifest:
         return False
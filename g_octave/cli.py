@@ -14,6 +14,7 @@ from __future__ import absolute_import, print_function
 
 import argparse
 import getpass
+import json
 import os
 import portage
 import tempfile
@@ -21,14 +22,18 @@ import traceback
 import shutil
 import sys
 
+from . import database
 from .checksum import sha1_check_db
 from .config import Config
-from .description_tree import DescriptionTree
+from .daemon import Daemon, query
+from .description import SvnDescription, re_pkg_atom
+from .description_tree import DescriptionTree, FILTER_FIELDS
 from .ebuild import Ebuild
 from .exception import GOctaveError
 from .fetch import fetch
+from .lock import overlay_lock
 from .log import Log
-from .overlay import create_overlay
+from .overlay import create_overlay, clean_overlay
 from .package_manager import get_by_name
 
 config = Config()
@@ -40,9 +45,12 @@ class Cli:
 
     bug_tracker = 'https://bugs.gentoo.org/'
 
-    def __init__(self):
+    def __init__(self, tree=None):
         log.info('Initializing g-octave.')
 
+        # a DescriptionTree object already loaded (used by the daemon)
+        self._tree = tree
+
         self.parser = argparse.ArgumentParser(
             description='A tool that generates and installs ebuilds for the octave-forge packages'
         )
@@ -92,7 +100,7 @@ class Cli:
             action = 'store_const',
             const = self.update,
             dest = 'action',
-            help = 'try to update a package or all the installed packages, if no atom provided.'
+            help = 'try to update some packages or all the installed packages, if no atom provided.'
         )
 
         self.actions.add_argument(
@@ -100,7 +108,23 @@ class Cli:
             action = 'store_const',
             const = self.search,
             dest = 'action',
-            help = 'package search (regular expressions allowed).'
+            help = 'package search (words are searched on the package metadata, regular expressions on the package names).'
+        )
+
+        self.actions.add_argument(
+            '--rdeps',
+            action = 'store_const',
+            const = self.rdeps,
+            dest = 'action',
+            help = 'show the packages that depend on the required package and exit.'
+        )
+
+        self.actions.add_argument(
+            '--filter',
+            action = 'store_const',
+            const = self.filter,
+            dest = 'action',
+            help = 'show the packages that match all the filters (like \'category:extra\', \'license:GPL*\', \'depends:>=sci-mathematics/octave-3.2\' or \'version:>=1.0\') and exit.'
         )
 
         self.actions.add_argument(
@@ -111,6 +135,14 @@ class Cli:
             help = 'try to unmerge a package, instead of merge.'
         )
 
+        self.actions.add_argument(
+            '--gc',
+            action = 'store_const',
+            const = self.gc,
+            dest = 'action',
+            help = 'remove the ebuilds of the packages that are neither available nor installed from the overlay.'
+        )
+
         self.actions.add_argument(
             '--config',
             action = 'store_const',
@@ -119,6 +151,14 @@ class Cli:
             help = 'return a value from the configuration file (/etc/g-octave.cfg)'
         )
 
+        self.actions.add_argument(
+            '--daemon',
+            action = 'store_const',
+            const = self.daemon,
+            dest = 'action',
+            help = 'run a daemon that keeps the package database in memory and answers the queries of g-octave.'
+        )
+
         self.parser.add_argument(
             '-p', '--pretend',
             action = 'store_true',
@@ -183,19 +223,45 @@ class Cli:
         )
 
         self.parser.add_argument(
-            'atom',
+            '--format',
+            choices = ['text', 'json'],
+            default = 'text',
+            dest = 'format',
+            help = 'output format of --list, --list-raw, --search, --info, --rdeps and --filter. \'json\' prints a JSON object per line.'
+        )
+
+        self.parser.add_argument(
+            '--no-daemon',
+            action = 'store_false',
+            dest = 'use_daemon',
+            help = 'don\'t use the query daemon, even if it is running'
+        )
+
+        self.parser.add_argument(
+            'atoms',
             metavar='ATOM',
             type=str,
-            nargs='?',
-            help='Package atom or regular expression (for search) or configuration key'
+            nargs='*',
+            help='Package atoms or regular expression (for search) or filters or configuration key'
         )
 
     def _init_tree(self):
+        if self._tree is not None:
+            self.tree = self._tree
+            return
         log.info('Initializing DescriptionTree.')
-        self.tree = DescriptionTree()
+        # the queries load only the packages that they need
+        self.tree = DescriptionTree(lazy=True)
+
+    def _query_actions(self):
+        # the daemon socket is world-writable and the daemon usually runs as
+        # root: only the public package data is served, the configuration
+        # (e.g. trac_passwd) is read by the client itself
+        return [self.list, self.list_raw, self.search, self.info, self.rdeps,
+            self.filter]
 
     def _required_atom(self):
-        if self.args.atom is None:
+        if len(self.args.atoms) == 0:
             self.parser.error('You need to provide a positional argument')
 
     def _init_pkg_manager(self):
@@ -210,34 +276,72 @@ class Cli:
         if not self.pkg_manager.is_installed():
             raise GOctaveError('Package manager not installed: %s' % config.package_manager)
 
-        current_user = getpass.getuser()
-        if current_user not in self.pkg_manager.allowed_users():
+        if not self.pkg_manager.is_allowed_user():
             raise GOctaveError(
                 'The current user (%s) can\'t run the current selected '
-                'package manager (%s)' % (current_user, config.package_manager)
+                'package manager (%s)' % (getpass.getuser(), config.package_manager)
             )
 
         # checking if the overlay is properly configured
         if not self.pkg_manager.check_overlay(config.overlay, out):
             raise GOctaveError('Overlay not properly configured.')
 
-    def _init_ebuild(self):
-        log.info('Initializing Ebuild: %s' % self.args.atom)
+    def _init_ebuilds(self):
+        log.info('Initializing Ebuilds: %s' % ', '.join(self.args.atoms))
         self._required_atom()
         self._init_pkg_manager()
         self._init_overlay()
-        self.ebuild = Ebuild(self.args.atom, self.args.force, self.args.scm, \
-            self.pkg_manager)
-        self.pkgatom = '=g-octave/' + self.ebuild.description.P
-        self.catpkg = 'g-octave/' + self.ebuild.description.PN
+        self._init_tree()
+        self.ebuilds = []
+        for atom in self.args.atoms:
+            self.ebuilds.append(Ebuild(atom, self.args.force, self.args.scm, \
+                self.pkg_manager, tree=self.tree))
+        self.pkgatoms = ['=g-octave/' + i.description.P for i in self.ebuilds]
+        self.catpkgs = ['g-octave/' + i.description.PN for i in self.ebuilds]
+
+    def _create_ebuilds(self):
+        for ebuild in self.ebuilds:
+            ebuild.create()
 
     def _init_overlay(self):
         log.info('Initializing Overlay.')
         create_overlay(self.args.force_all)
 
+    def _print_json(self, pkg, versions=None):
+        record = dict(
+            name = pkg.PN,
+            category = pkg.CAT,
+            depends = pkg.depends,
+            self_depends = [list(i) for i in pkg.self_depends],
+            license = pkg.license,
+            license_gentoo = pkg.license_gentoo,
+        )
+        if versions is not None:
+            record['versions'] = versions
+        else:
+            record.update(
+                version = pkg.PV,
+                date = pkg.date,
+                maintainer = pkg.maintainer,
+                title = pkg.title,
+                description = pkg.description,
+                categories = pkg.categories,
+                url = pkg.url,
+                buildrequires = pkg.buildrequires,
+                systemrequirements = pkg.systemrequirements,
+            )
+        print(json.dumps(record, sort_keys=True))
+        sys.stdout.flush()
+
+    def _walk_json(self):
+        for pkg, versions in self.tree.walk():
+            self._print_json(pkg, versions)
+
     def list(self):
         log.info('Listing packages.')
         self._init_tree()
+        if self.args.format == 'json':
+            return self._walk_json()
         print()
         print(portage.output.blue('Available packages:'))
         print()
@@ -262,6 +366,8 @@ class Cli:
     def list_raw(self):
         log.info('Listing packages (raw mode).')
         self._init_tree()
+        if self.args.format == 'json':
+            return self._walk_json()
         packages = self.tree.list()
         for cat in packages:
             for pkg in packages[cat]:
@@ -269,69 +375,134 @@ class Cli:
 
     def info(self):
         log.info('Listing description of a package.')
-        self._init_ebuild()
-        pkg = self.ebuild.description
-        print(portage.output.blue('Package:'), portage.output.white(str(pkg.name)))
-        print(portage.output.blue('Version:'), portage.output.white(str(pkg.version)))
-        print(portage.output.blue('Date:'), portage.output.white(str(pkg.date)))
-        print(portage.output.blue('Maintainer:'), portage.output.white(str(pkg.maintainer)))
-        print(portage.output.blue('Description:'), portage.output.white(str(pkg.description)))
-        print(portage.output.blue('Categories:'), portage.output.white(str(pkg.categories)))
-        print(portage.output.blue('License:'), portage.output.white(str(pkg.license)))
-        print(portage.output.blue('Url:'), portage.output.white(str(pkg.url)))
+        self._required_atom()
+        self._init_tree()
+        for atom in self.args.atoms:
+            pkg = self.tree.lookup(atom)
+            if pkg is None:
+                raise GOctaveError('Package not found: %s' % atom)
+            if self.args.scm:
+                pkg = SvnDescription(pkg.CAT, pkg.PN)
+            if self.args.format == 'json':
+                self._print_json(pkg)
+                continue
+            print(portage.output.blue('Package:'), portage.output.white(str(pkg.name)))
+            print(portage.output.blue('Version:'), portage.output.white(str(pkg.version)))
+            print(portage.output.blue('Date:'), portage.output.white(str(pkg.date)))
+            print(portage.output.blue('Maintainer:'), portage.output.white(str(pkg.maintainer)))
+            print(portage.output.blue('Description:'), portage.output.white(str(pkg.description)))
+            print(portage.output.blue('Categories:'), portage.output.white(str(pkg.categories)))
+            print(portage.output.blue('License:'), portage.output.white(str(pkg.license)))
+            print(portage.output.blue('Url:'), portage.output.white(str(pkg.url)))
+            print()
+
+    def rdeps(self):
+        log.info('Listing reverse dependencies of a package.')
+        self._required_atom()
+        self._init_tree()
+        for atom in self.args.atoms:
+            # the version doesn't need to be available, only the package
+            pkgatom = re_pkg_atom.match(atom)
+            pn = pkgatom is not None and pkgatom.group(1) or atom
+            if self.tree.latest_version(pn) is None:
+                raise GOctaveError('Package not found: %s' % atom)
+            packages = self.tree.reverse_dependencies(atom)
+            if self.args.format == 'json':
+                for p in packages:
+                    self._print_json(self.tree.get(p))
+                continue
+            print(
+                portage.output.blue('Packages depending on '),
+                portage.output.white(atom),
+                portage.output.blue(':\n'),
+                sep = ''
+            )
+            for p in packages:
+                print(
+                    portage.output.green('Package:'),
+                    portage.output.white(p)
+                )
+            print()
+
+    def filter(self):
+        self._required_atom()
+        criteria = {}
+        for expr in self.args.atoms:
+            field, sep, value = expr.partition(':')
+            if sep == '' or field not in FILTER_FIELDS:
+                self.parser.error('Invalid filter: %s (valid fields: %s)' % \
+                    (expr, ', '.join(FILTER_FIELDS)))
+            criteria.setdefault(field, []).append(value)
+        log.info('Filtering packages: %s' % ' '.join(self.args.atoms))
+        self._init_tree()
+        packages = self.tree.filter(**criteria)
+        if self.args.format == 'json':
+            for p in packages:
+                self._print_json(self.tree.get(p))
+            return
+        for p in packages:
+            print(
+                portage.output.green('Package:'),
+                portage.output.white(p)
+            )
 
     def update(self):
         self._init_pkg_manager()
-        if self.args.atom is not None:
-            log.info('Calling the package manager to update the package.')
-            self._init_ebuild()
-            ret = self.pkg_manager.update_package(self.pkgatom, self.catpkg)
+        if len(self.args.atoms) > 0:
+            log.info('Calling the package manager to update the packages.')
+            self._init_ebuilds()
+            with overlay_lock():
+                ret = self.pkg_manager.update_package(self.pkgatoms, self.catpkgs)
         else:
             log.info('Calling the package manager to update all the installed packages.')
-            ret = self.pkg_manager.update_package()
+            with overlay_lock():
+                ret = self.pkg_manager.update_package()
         if ret != os.EX_OK:
             raise GOctaveError('Update failed!')
 
     def search(self):
         self._init_tree()
-        self._init_overlay()
         self._required_atom()
-        log.info('Searching for packages: %s' % self.args.atom)
+        term = self.args.atoms[0]
+        log.info('Searching for packages: %s' % term)
+        packages = self.tree.search_results(term)
+        if self.args.format == 'json':
+            for pn, versions in packages:
+                self._print_json(self.tree.lookup(pn), versions)
+            return
         print(
             portage.output.blue('Search results for '),
-            portage.output.white(self.args.atom),
+            portage.output.white(term),
             portage.output.blue(':\n'),
             sep = ''
         )
-        packages = self.tree.search(self.args.atom)
-        for pkg in packages:
+        for pkg, versions in packages:
             print(
                 portage.output.green('Package:'),
                 portage.output.white(pkg)
             )
             print(
                 portage.output.green('Available versions:'),
-                portage.output.red(', '.join(packages[pkg]))
+                portage.output.red(', '.join(versions))
             )
             print()
 
     def merge(self):
-        self._init_pkg_manager()
-        self._init_ebuild()
-        self._required_atom()
-        log.info('Merging package: %s' % self.args.atom)
-        self.ebuild.create()
-        ret = self.pkg_manager.install_package(self.pkgatom, self.catpkg)
+        self._init_ebuilds()
+        log.info('Merging packages: %s' % ', '.join(self.args.atoms))
+        self._create_ebuilds()
+        # the overlay can't be recreated while the package manager uses it
+        with overlay_lock():
+            ret = self.pkg_manager.install_package(self.pkgatoms, self.catpkgs)
         if ret != os.EX_OK:
             raise GOctaveError('Merge failed!')
 
     def unmerge(self):
-        self._init_pkg_manager()
-        self._init_ebuild()
-        self._required_atom()
-        log.info('Unmerging package: %s' % self.args.atom)
-        self.ebuild.create()
-        ret = self.pkg_manager.uninstall_package(self.pkgatom, self.catpkg)
+        self._init_ebuilds()
+        log.info('Unmerging packages: %s' % ', '.join(self.args.atoms))
+        self._create_ebuilds()
+        with overlay_lock():
+            ret = self.pkg_manager.uninstall_package(self.pkgatoms, self.catpkgs)
         if ret != os.EX_OK:
             raise GOctaveError('Unmerge failed!')
 
@@ -339,33 +510,92 @@ class Cli:
         log.info('Searching updates ...')
         out.einfo('Searching updates ...')
 
-        if self.args.force and os.path.exists(config.db):
-            shutil.rmtree(config.db)
+        # the package database is kept while the new one is downloaded
+        cache = os.path.join(config.db, 'cache')
+        if self.args.force and os.path.exists(cache):
+            shutil.rmtree(cache)
 
         if not self.updates.fetch_db():
             log.info('No updates available')
             out.einfo('No updates available')
         else:
-            self.updates.extract()
+            gen = self.updates.extract()
+            if gen is None:
+                raise GOctaveError('Failed to extract the package database.')
             log.info('Checking SHA1 checksums ...')
             out.ebegin('Checking SHA1 checksums')
-            self._init_tree()
-            if sha1_check_db(self.tree):
+            if sha1_check_db(DescriptionTree(db=gen)):
                 out.eend(0)
             else:
                 out.eend(1)
-                if os.path.exists(config.db):
-                    shutil.rmtree(config.db)
+                # the current generation is still valid
+                shutil.rmtree(gen)
+                shutil.rmtree(cache)
                 raise GOctaveError('Package database SHA1 checksum failed!')
+            database.publish(gen)
+            database.reclaim()
+
+    def gc(self):
+        log.info('Cleaning the overlay.')
+        self._init_pkg_manager()
+        self._init_overlay()
+        self._init_tree()
+        removed = clean_overlay(self.tree, self.pkg_manager.installed_packages(),
+            self.pkg_manager.create_manifest)
+        if len(removed) == 0:
+            out.einfo('Nothing to clean.')
+
+    def daemon(self):
+        log.info('Starting the daemon.')
+        if config.daemon_socket in [None, '']:
+            raise GOctaveError('No socket configured for the daemon (daemon_socket).')
+        out.einfo('Starting the daemon: %s' % config.daemon_socket)
+        Daemon().serve_forever()
 
     def config(self):
         log.info('Retrieving configuration option.')
         self._required_atom()
-        print(config.__getattr__(self.args.atom))
+        print(config.__getattr__(self.args.atoms[0]))
+
+    def run_query(self, argv):
+        '''runs a query action inside of the daemon. Returns the return code,
+        or None if the action isn't a query.'''
+        try:
+            self.args = self.parser.parse_args(argv)
+        except SystemExit as err:
+            return err.code
+        if self.args.action not in self._query_actions():
+            return None
+        havecolor = portage.output.havecolor
+        if not self.args.colors:
+            portage.output.nocolor()
+        try:
+            self.args.action()
+        except GOctaveError as err:
+            log.error(str(err))
+            out.eerror(str(err))
+            return os.EX_USAGE
+        except SystemExit as err:
+            # invalid arguments, reported with self.parser.error
+            return err.code
+        finally:
+            portage.output.havecolor = havecolor
+        return os.EX_OK
 
-    def _run(self):
+    def _run(self, argv=None):
         log.info('Running the command-line interface.')
-        self.args = self.parser.parse_args()
+        if argv is None:
+            argv = sys.argv[1:]
+        self.args = self.parser.parse_args(argv)
+
+        # try to get the answer from the daemon
+        if self.args.use_daemon and self.args.action in self._query_actions():
+            response = query(argv)
+            if response is not None:
+                sys.stdout.write(response['output'])
+                sys.stderr.write(response['errors'])
+                return response['returncode']
+
         if not self.args.colors:
             portage.output.nocolor()
 
@@ -382,9 +612,11 @@ class Cli:
         self.args.action()
         return os.EX_OK
 
-    def run(self):
+    def run(self, argv=None):
+        '''runs the command-line interface with the arguments from 'argv'
+        (a list), or from sys.argv. Returns the exit code.'''
         try:
-            return self._run()
+            return self._run(argv)
         except GOctaveError as err:
             log.error(str(err))
             out.eerror(str(err))
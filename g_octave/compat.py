@@ -14,6 +14,7 @@
 __all__ = [
     'py3k',
     'open',
+    'intern',
 ]
 
 import codecs
@@ -22,6 +23,15 @@ import sys
 
 py3k = sys.version_info >= (3, 0)
 
+if py3k:
+    intern = sys.intern
+else:
+    # the builtin 'intern' doesn't accept unicode objects
+    _interned = {}
+    def intern(string):
+        '''returns the first equal string that was interned'''
+        return _interned.setdefault(string, string)
+
 def open(filename, mode='r', encoding='utf-8'):
     '''custom implementation of the 'open' builtin, using the codecs module'''
     try:
@@ -39,6 +39,7 @@ class Config(object):
         'log_file': '/var/log/g-octave.log',
         'package_manager': 'portage',
         'use_scm': 'false',
+        'daemon_socket': '/var/run/g-octave.socket',
     }
 
     _section_name = 'main'
@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+
+"""
+    g_octave.daemon
+    ~~~~~~~~~~~~~~~
+
+    This module implements a resident daemon that keeps the package database
+    loaded in memory and answers the queries of the command-line interface
+    (--list, --list-raw, --search, --info, --rdeps, --filter and --config)
+    over a Unix socket, and the client used by the command-line interface to talk with it.
+
+    The protocol is very simple: the client sends a JSON object with the
+    command-line arguments and the g-octave environment variables, in a
+    single line, and the daemon answers with another JSON object, with the
+    output of the command and its return code.
+
+    :copyright: (c) 2010 by Rafael Goncalves Martins
+    :license: GPL-2, see LICENSE for more details.
+"""
+
+from __future__ import absolute_import
+
+__all__ = [
+    'Daemon',
+    'query',
+]
+
+import json
+import os
+import socket
+import sys
+import threading
+
+from . import database
+from .compat import py3k
+from .config import Config
+from .description_tree import DescriptionTree
+from .exception import GOctaveError
+from .log import Log
+
+if py3k:
+    from io import StringIO
+else:
+    from StringIO import StringIO
+
+config = Config()
+log = Log('g_octave.daemon')
+
+
+def _environ():
+    # the environment variables that change the configuration of g-octave
+    return dict([(i, os.environ[i]) for i in os.environ \
+        if i.upper().startswith(Config._environ_namespace)])
+
+def _send(sock, obj):
+    sock.sendall((json.dumps(obj) + '\n').encode('utf-8'))
+
+def _recv(sock):
+    data = b''
+    while not data.endswith(b'\n'):
+        chunk = sock.recv(4096)
+        if not chunk:
+            break
+        data += chunk
+    return json.loads(data.decode('utf-8'))
+
+
+class Daemon(object):
+
+    def __init__(self, socket_path=None, timeout=10):
+        # timeout: seconds to wait for the request of a client
+        self.socket_path = socket_path or config.daemon_socket
+        self.timeout = timeout
+        self._tree = None
+        self._signature = None
+        self._stopped = threading.Event()
+
+    def _db_signature(self):
+        db_dir = database.path()
+        signature = [db_dir]
+        for f in ['manifest.json', 'info.json', 'octave-forge']:
+            try:
+                signature.append(os.stat(os.path.join(db_dir, f)).st_mtime)
+            except OSError:
+                signature.append(None)
+        return tuple(signature)
+
+    @property
+    def tree(self):
+        '''the DescriptionTree object, refreshed if the package database
+        changed since the last query.'''
+        signature = self._db_signature()
+        if self._tree is None:
+            log.info('Loading the package database.')
+            self._tree = DescriptionTree()
+        elif signature != self._signature:
+            log.info('Refreshing the package database.')
+            self._tree.refresh()
+        self._signature = signature
+        return self._tree
+
+    def handle(self, request):
+        '''runs a query and returns the response (a dict)'''
+
+        # the configuration of the client must be the same of the daemon
+        if request.get('environ') != _environ():
+            return dict(fallback=True)
+
+        # avoiding circular imports
+        from .cli import Cli
+        cli = Cli(tree=self.tree)
+
+        stdout, stderr = sys.stdout, sys.stderr
+        sys.stdout, sys.stderr = StringIO(), StringIO()
+        try:
+            returncode = cli.run_query(request.get('args', []))
+            output, errors = sys.stdout.getvalue(), sys.stderr.getvalue()
+        finally:
+            sys.stdout, sys.stderr = stdout, stderr
+
+        if returncode is None:
+            return dict(fallback=True)
+        return dict(returncode=returncode, output=output, errors=errors)
+
+    def _bind(self):
+        if os.path.exists(self.socket_path):
+            if _ping(self.socket_path):
+                raise GOctaveError('Daemon already running: %s' % self.socket_path)
+            # stale socket
+            os.unlink(self.socket_path)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(self.socket_path)
+        # any user can query the package database; the daemon doesn't
+        # serve anything else (see Cli._query_actions)
+        os.chmod(self.socket_path, 0o666)
+        sock.listen(5)
+        return sock
+
+    def serve_forever(self):
+        sock = self._bind()
+        self._stopped.clear()
+        log.info('Daemon listening: %s' % self.socket_path)
+        try:
+            while True:
+                conn, addr = sock.accept()
+                if self._stopped.is_set():
+                    conn.close()
+                    break
+                # a client that never sends its request can't block the
+                # daemon
+                conn.settimeout(self.timeout)
+                try:
+                    request = _recv(conn)
+                    if request.get('ping'):
+                        _send(conn, dict(pong=True))
+                    else:
+                        _send(conn, self.handle(request))
+                except KeyboardInterrupt:
+                    raise
+                except BaseException as err:
+                    log.error('Failed to answer a query: %s' % err)
+                finally:
+                    conn.close()
+        finally:
+            sock.close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+    def shutdown(self):
+        '''stops the serve_forever loop, running in another thread.'''
+        self._stopped.set()
+        # wakes up the loop
+        sock = _connect(self.socket_path, self.timeout)
+        if sock is not None:
+            sock.close()
+
+
+def _connect(socket_path, timeout):
+    if socket_path in [None, ''] or not os.path.exists(socket_path):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(socket_path)
+    except socket.error:
+        sock.close()
+        return None
+    return sock
+
+def _ping(socket_path, timeout=5):
+    '''checks if there's a daemon answering on the socket.'''
+    sock = _connect(socket_path, timeout)
+    if sock is None:
+        return False
+    try:
+        _send(sock, dict(ping=True))
+        return _recv(sock).get('pong', False)
+    except (socket.error, ValueError):
+        return False
+    finally:
+        sock.close()
+
+def query(args, socket_path=None, timeout=60):
+    '''sends a query (a list of command-line arguments) to the daemon and
+    returns the response (a dict with the keys 'returncode', 'output' and
+    'errors'), or None if the daemon isn't running or can't answer it.'''
+    sock = _connect(socket_path or config.daemon_socket, timeout)
+    if sock is None:
+        return None
+    try:
+        _send(sock, dict(args=args, environ=_environ()))
+        response = _recv(sock)
+    except (socket.error, ValueError) as err:
+        log.error('Failed to query the daemon: %s' % err)
+        return None
+    finally:
+        sock.close()
+    if response.get('fallback', False):
+        return None
+    return response
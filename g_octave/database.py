@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+
+"""
+    g_octave.database
+    ~~~~~~~~~~~~~~~~~
+
+    This module implements the versioned layout of the package database.
+
+    Each sync extracts the package database to a new generation directory
+    (``generations/<name>``), verifies it, and then points the ``current``
+    symlink to it atomically. The readers keep using the generation that was
+    current when they started, holding a shared Lock on it, and the old
+    generations are removed only when no reader holds them anymore. This
+    way, the package database never disappears while a sync is running.
+
+    The old flat layout (the files directly inside the database directory,
+    without the ``current`` symlink) is still supported for reading. Its
+    readers hold a shared Lock on the database directory itself, and its
+    files are removed by reclaim, after the first generation is published,
+    when no reader holds them anymore.
+
+    :copyright: (c) 2010 by Rafael Goncalves Martins
+    :license: GPL-2, see LICENSE for more details.
+"""
+
+from __future__ import absolute_import
+
+__all__ = [
+    'path',
+    'generations',
+    'new_generation',
+    'publish',
+    'hold',
+    'hold_current',
+    'reclaim',
+]
+
+import os
+import shutil
+import tempfile
+import time
+
+from .config import Config
+from .lock import Lock
+from .log import Log
+
+conf = Config()
+log = Log('g_octave.database')
+
+# the file locked by the readers of a generation
+lock_file = '.lock'
+
+# the files of the old flat layout
+flat_files = ['timestamp', 'info.json', 'patches', 'octave-forge', 'manifest.json']
+
+
+def _generations_dir():
+    return os.path.join(os.path.realpath(conf.db), 'generations')
+
+def _current_link():
+    return os.path.join(conf.db, 'current')
+
+def _is_flat(db_dir):
+    return os.path.realpath(db_dir) == os.path.realpath(conf.db)
+
+def path():
+    '''returns the path of the current generation of the package database,
+    or the database directory itself, for the old flat layout.'''
+    current = _current_link()
+    if os.path.islink(current):
+        return os.path.realpath(current)
+    return conf.db
+
+def generations():
+    '''returns a sorted list with the paths of all the generations.'''
+    generations_dir = _generations_dir()
+    if not os.path.isdir(generations_dir):
+        return []
+    return sorted([os.path.join(generations_dir, i) \
+        for i in os.listdir(generations_dir)])
+
+def new_generation():
+    '''creates an empty generation directory, not used by the readers until
+    published. Returns a tuple with its path and the shared Lock that keeps
+    it from being reclaimed while it is filled.'''
+    generations_dir = _generations_dir()
+    if not os.path.exists(generations_dir):
+        os.makedirs(generations_dir, 0o755)
+    gen = tempfile.mkdtemp(
+        prefix=time.strftime('%Y%m%d%H%M%S-'),
+        dir=generations_dir
+    )
+    os.chmod(gen, 0o755)
+    lock = Lock(os.path.join(gen, lock_file))
+    lock.acquire()
+    log.info('New generation of the package database: %s' % gen)
+    return gen, lock
+
+def publish(gen):
+    '''makes 'gen' the current generation, atomically.'''
+    current = _current_link()
+    tmp_link = '%s.%i' % (current, os.getpid())
+    if os.path.islink(tmp_link):
+        os.unlink(tmp_link)
+    os.symlink(os.path.relpath(gen, conf.db), tmp_link)
+    os.rename(tmp_link, current)
+    log.info('Current generation of the package database: %s' % gen)
+
+def hold(db_dir):
+    '''takes a shared lock on a generation (or on the old flat layout), so
+    it isn't reclaimed while it is being used. Returns the Lock object, or
+    None if the generation was already reclaimed.'''
+    if _is_flat(db_dir):
+        lock = Lock(db_dir, create=False)
+    else:
+        lock = Lock(os.path.join(db_dir, lock_file), create=False)
+    if lock.acquire():
+        return lock
+    return None
+
+def hold_current():
+    '''returns a tuple with the path of the current generation (see path)
+    and the shared Lock that keeps it from being reclaimed. If the generation
+    is reclaimed before the lock is taken, the new current generation is
+    used. The Lock is None only if there's nothing to hold (e.g. the package
+    database wasn't synced yet).'''
+    db_dir = path()
+    while True:
+        lock = hold(db_dir)
+        current = path()
+        if lock is not None and current != db_dir and _is_flat(db_dir) and \
+          not os.path.exists(os.path.join(db_dir, 'info.json')):
+            # the old flat layout was already removed by reclaim
+            lock.release()
+            lock = None
+        if lock is not None or current == db_dir:
+            return db_dir, lock
+        log.info('Generation reclaimed before used: %s' % db_dir)
+        db_dir = current
+
+def _reclaim_flat():
+    # removes the files of the old flat layout, if a generation was already
+    # published and they aren't used anymore
+    if not os.path.islink(_current_link()):
+        return False
+    files = [os.path.join(conf.db, i) for i in flat_files]
+    if not any([os.path.exists(i) for i in files]):
+        return False
+    lock = Lock(conf.db, exclusive=True, create=False)
+    if not lock.acquire(blocking=False):
+        log.info('Old package database still in use: %s' % conf.db)
+        return False
+    try:
+        for f in files:
+            if os.path.isdir(f):
+                shutil.rmtree(f)
+            elif os.path.isfile(f):
+                os.unlink(f)
+    finally:
+        lock.release()
+    log.info('Old package database removed: %s' % conf.db)
+    return True
+
+def reclaim():
+    '''removes the generations that aren't current and aren't held by any
+    reader, and the files of the old flat layout. Returns the list of
+    removed generations.'''
+    _reclaim_flat()
+    current = path()
+    removed = []
+    for gen in generations():
+        if gen == current:
+            continue
+        lock_path = os.path.join(gen, lock_file)
+        lock = Lock(lock_path, exclusive=True, create=False)
+        # generations without the lock file are leftovers of interrupted
+        # syncs
+        if os.path.exists(lock_path):
+            if not lock.acquire(blocking=False):
+                log.info('Generation still in use: %s' % gen)
+                continue
+            # the readers waiting for the lock will notice this
+            os.unlink(lock_path)
+        try:
+            shutil.rmtree(gen)
+        finally:
+            lock.release()
+        removed.append(gen)
+        log.info('Generation removed: %s' % gen)
+    return removed
@@ -19,6 +19,9 @@ from __future__ import absolute_import
 __all__ = [
     'Description',
     'SvnDescription',
+    'parse_description',
+    'depends_cache',
+    'translate_depend',
     're_depends',
     're_pkg_atom',
     're_desc_file',
@@ -26,16 +29,16 @@ __all__ = [
 
 import os
 import re
-import shutil
-import tempfile
 
 from contextlib import closing
 
+from . import database
 from .config import Config
-from .compat import py3k
+from .compat import py3k, intern
 from .checksum import sha1_compute
 from .exception import GOctaveError
 from .info import Info
+from .lru import LRUCache
 
 if py3k:
     import urllib.request as urllib
@@ -47,9 +50,105 @@ log = Log('g_octave.description')
 
 conf = Config()
 
+# Info objects already loaded: filename -> (mtime, Info)
+_info_cache = {}
+
+def get_info(filename):
+    '''returns an Info object for the given file, reusing the previously
+    loaded object if the file wasn't modified.'''
+    try:
+        mtime = os.stat(filename).st_mtime
+    except OSError:
+        mtime = None
+    cached = _info_cache.get(filename)
+    if cached is None or cached[0] != mtime:
+        cached = (mtime, Info(filename))
+        _info_cache[filename] = cached
+    return cached[1]
+
 # octave-forge DESCRIPTION's dependencies atoms
 re_depends = re.compile(r'^([a-zA-Z0-9-]+) *(\( *([><=]?=?) *([0-9.]+) *\))?')
 
+# the same dependencies appear on a lot of packages:
+# raw dependency entry -> (gentoo atom, (name, comparator, version))
+depends_cache = LRUCache(2048)
+
+# the Info object used to translate the cached dependencies
+_depends_cache_info = None
+
+def translate_depend(depend, info):
+    '''returns a tuple (atom, self_depend) for a dependency entry like
+    'octave (>= 3.2.0)', where 'atom' is the gentoo atom (or None, if the
+    dependency should be ignored) and 'self_depend' is a tuple (name,
+    comparator, version) for the other octave-forge packages (or None).
+    The results are cached, while the Info object doesn't change.'''
+    global _depends_cache_info
+    if info is not _depends_cache_info:
+        depends_cache.clear()
+        _depends_cache_info = info
+
+    depend = depend.strip()
+    cached = depends_cache.get(depend)
+    if cached is not None:
+        return cached
+
+    # use the 're_depends' regular expression to filter the
+    # package name, the version an the comparator
+    re_match = re_depends.match(depend)
+
+    # invalid dependency atom
+    if re_match is None:
+        log.error('Invalid dependency atom: %s' % depend)
+        raise GOctaveError('Invalid dependency atom: %s' % depend)
+
+    # extract the needed values
+    name = re_match.group(1)
+    comparator = re_match.group(3)
+    version = re_match.group(4)
+
+    # initialize the atom string empty
+    atom = ''
+    self_depend = None
+
+    # we have a comparator and a version?
+    if comparator is not None and version is not None:
+
+        # special case: '==' for octave forge is '=' for gentoo
+        if comparator == '==':
+            atom += '='
+        else:
+            atom += comparator
+
+    # as octave is already in the portage tree, the atom is
+    # predefined.
+    if name.lower() == 'octave':
+        atom += 'sci-mathematics/octave'
+
+    else:
+        # we need only the octave-forge packages, nor octave
+        self_depend = tuple([i is not None and intern(i) or None \
+            for i in (name, comparator, version)])
+
+        if name in info.dependencies:
+            if info.dependencies[name] == '':
+                atom = None
+            else:
+                atom += info.dependencies[name]
+
+        # the octave-forge packages will be put inside a "fake"
+        # category: g-octave
+        else:
+            atom += 'g-octave/' + str(name)
+
+    # append the version to the atom, if needed
+    if atom is not None:
+        if comparator is not None and version is not None:
+            atom += '-' + str(version)
+        atom = intern(atom)
+
+    depends_cache[depend] = (atom, self_depend)
+    return atom, self_depend
+
 # we'll use atoms like 'control-1.0.11' for g-octave packages
 re_pkg_atom = re.compile(r'^(.+)-([0-9.]+)$')
 
@@ -57,102 +156,105 @@ re_pkg_atom = re.compile(r'^(.+)-([0-9.]+)$')
 re_desc_file = re.compile(r'^((.+)-([0-9.]+))\.DESCRIPTION$')
 
 
+# lines of the DESCRIPTION files: 'key: value' (any line with a ':') or
+# continuations of the previous value (lines starting with a space)
+re_desc_line = re.compile(r'^(?:([^:\n]*):([^\n]*)|( [^\n]*))$', re.M)
+
+# keys whose repeated values are separated by ', ', instead of ' '
+_depends_keys = ('depends', 'systemrequirements', 'buildrequires')
+
+def parse_description(source):
+    """parses the content of a DESCRIPTION file (bytes, or a file object
+    opened in binary mode) and returns a dict with the raw values, with
+    lower case keys.
+    """
+    if hasattr(source, 'read'):
+        source = source.read()
+    if isinstance(source, bytes):
+        source = source.decode('iso-8859-15')
+
+    # key -> list of the pieces of the value
+    values = {}
+
+    # current key
+    key = None
+
+    for match in re_desc_line.finditer(source):
+        continuation = match.group(3)
+        if continuation is not None:
+            # the first line can't be a continuation, obviously :)
+            if key is not None:
+                # our line already have a single space at the start.
+                values[key].append(continuation.rstrip())
+            continue
+        key = intern(match.group(1).strip().lower())
+        value = match.group(2).strip()
+        if key in values:
+            values[key].append(key in _depends_keys and ', ' or ' ')
+            values[key].append(value)
+        else:
+            values[key] = [value]
+
+    return dict([(i, ''.join(values[i])) for i in values])
+
+
 class Description(object):
 
-    # gentoo ebuild variables
-    P = None
-    PN = None
-    PV = None
-    CAT = None
+    # a lot of Description objects are kept in memory by the DescriptionTree,
+    # so we avoid a __dict__ for each one of them.
+    __slots__ = ('P', 'PN', 'PV', 'CAT', '_file', '_info', '_desc')
 
     _categories = ['main', 'extra', 'language', 'nonfree']
 
-    def __init__(self, file, parse_sysreq=True):
+    # values that are repeated between packages (or between the versions of
+    # a package), and are interned to be stored only once.
+    _interned = ['name', 'version', 'date', 'author', 'maintainer', 'title',
+        'categories', 'url', 'autoload', 'license', 'license_gentoo']
+
+    # dependency lists, stored as tuples
+    _lists = ['depends', 'buildrequires', 'systemrequirements', 'self_depends']
+
+    def __init__(self, file, parse_sysreq=True, source=None, db=None):
+        """file is the path of the DESCRIPTION file. If 'source' (bytes or a
+        file object) is provided, it is parsed instead of the file, and the
+        path is only used to find the package name, version and category.
+        'db' is the directory of the package database with the info.json
+        file, the current generation by default.
+        """
+
+        # gentoo ebuild variables
+        self.P = None
+        self.PN = None
+        self.PV = None
+        self.CAT = None
 
         log.info('Parsing file: %s' % file)
 
-        if not os.path.exists(file):
+        if source is None and not os.path.exists(file):
             log.error('File not found: %s' % file)
             raise GOctaveError('File not found: %s' % file)
 
         self._file = file
-        self._info = Info(os.path.join(conf.db, 'info.json'))
+        if db is None:
+            db = database.path()
+        self._info = get_info(os.path.join(db, 'info.json'))
 
         my_atom = re_desc_file.match(os.path.basename(self._file))
         if my_atom is not None:
-            self.P = my_atom.group(1)
-            self.PN = my_atom.group(2)
-            self.PV = my_atom.group(3)
+            self.P = intern(my_atom.group(1))
+            self.PN = intern(my_atom.group(2))
+            self.PV = intern(my_atom.group(3))
 
         file_parts = self._file.split(os.sep)
         if len(file_parts) >= 3 and file_parts[-3] in self._categories:
-            self.CAT = file_parts[-3]
+            self.CAT = intern(file_parts[-3])
 
         # dictionary with the parsed content of the DESCRIPTION file
-        self._desc = dict()
-
-        # current key
-        key = None
-
-        with open(file, 'rb') as fp:
-            for line in fp:
-
-                line = line.decode('iso-8859-15')
-                line_splited = line.split(':')
-
-                # 'key: value' found?
-                if len(line_splited) >= 2:
-
-                    # by default we have a key before the first ':'
-                    key = line_splited[0].strip().lower()
-
-                    # all the stuff after the first ':' is the value
-                    # ':' included.
-                    value = ':'.join(line_splited[1:]).strip()
-
-                    # the key already exists?
-                    if key in self._desc:
-
-                        # it's one of the dependencies?
-                        if key in ('depends', 'systemrequirements', 'buildrequires'):
-
-                            # use ', ' to separate the values
-                            self._desc[key] += ', '
-
-                        else:
-
-                            # use a single space to separate the values
-                            self._desc[key] += ' '
-
-                    # key didn't exists yet. initializing...
-                    else:
-                        self._desc[key] = ''
-
-                    self._desc[key] += value
-
-                # it's not a 'key: value', so it's probably a continuation
-                # of the previous line.
-                else:
-
-                    # empty line
-                    if len(line) == 0:
-                        continue
-
-                    # comments (started with '#')
-                    if line[0] == '#':
-                        continue
-
-                    # line continuations starts with a single space
-                    if line[0] != ' ':
-                        continue
-
-                    # the first line can't be a continuation, obviously :)
-                    if key is None:
-                        continue
-
-                    # our line already have a single space at the start.
-                    # we only needs strip spaces at the end of the line
-                    self._desc[key] += line.rstrip()
+        if source is None:
+            with open(file, 'rb') as fp:
+                self._desc = parse_description(fp)
+        else:
+            self._desc = parse_description(source)
 
         # add the 'self_depends' key
         self._desc['self_depends'] = list()
@@ -160,126 +262,58 @@ class Description(object):
         # add the 'gentoo_license' key
         self._desc['license_gentoo'] = ''
 
-        # parse the dependencies and license
+        # depends, tokenized only once for both keys
+        if 'depends' in self._desc:
+            translated = self._translate_depends(self._desc['depends'])
+            self._desc['depends'] = self._atoms(translated)
+            self._desc['self_depends'] = [i[1] for i in translated \
+                if i[1] is not None]
+
+        # requirements
+        if parse_sysreq:
+            for key in ('systemrequirements', 'buildrequires'):
+                if key in self._desc:
+                    self._desc[key] = self._parse_depends(self._desc[key])
+
+        # license
+        if 'license' in self._desc:
+            try:
+                new_license = self._info.licenses.get(self._desc['license'])
+            except:
+                new_license = ''
+            if new_license not in [None, '']:
+                self._desc['license_gentoo'] = new_license
+            else:
+                self._desc['license_gentoo'] = self._desc['license']
+
         for key in self._desc:
+            if key in self._interned:
+                self._desc[key] = intern(self._desc[key])
+            elif key in self._lists and isinstance(self._desc[key], list):
+                self._desc[key] = tuple(self._desc[key])
+
 
-            # depends
-            if key == 'depends':
-                depends = self._desc[key]
-                self._desc[key] = self._parse_depends(depends)
-                self._desc['self_depends'] = self._parse_self_depends(depends)
+    def _translate_depends(self, depends):
+        return [translate_depend(i, self._info) for i in depends.split(',')]
 
-            # requirements
-            if key in ('systemrequirements', 'buildrequires') and parse_sysreq:
-                self._desc[key] = self._parse_depends(self._desc[key])
 
-            # license
-            if key == 'license':
-                try:
-                    new_license = self._info.licenses.get(self._desc['license'])
-                except:
-                    new_license = ''
-                if new_license not in [None, '']:
-                    self._desc['license_gentoo'] = new_license
-                else:
-                    self._desc['license_gentoo'] = self._desc['license']
+    def _atoms(self, translated):
+        return list(set([i[0] for i in translated if i[0] is not None]))
 
 
     def _parse_depends(self, depends):
         """returns a list with gentoo atoms for the 'depends' (the other
         octave-forge packages or the octave itself)
         """
-
-        # the list that will be returned
-        depends_list = list()
-
-        for depend in depends.split(','):
-
-            # use the 're_depends' regular expression to filter the
-            # package name, the version an the comparator
-            re_match = re_depends.match(depend.strip())
-
-            # the depend is valid?
-            if re_match is not None:
-
-                # initialize the atom string empty
-                atom = ''
-
-                # extract the needed values
-                name = re_match.group(1)
-                comparator = re_match.group(3)
-                version = re_match.group(4)
-
-                # we have a comparator and a version?
-                if comparator is not None and version is not None:
-
-                    # special case: '==' for octave forge is '=' for gentoo
-                    if comparator == '==':
-                        atom += '='
-                    else:
-                        atom += comparator
-
-                # as octave is already in the portage tree, the atom is
-                # predefined.
-                if name.lower() == 'octave':
-                    atom += 'sci-mathematics/octave'
-
-                elif name in self._info.dependencies:
-                    if self._info.dependencies[name] == '':
-                        continue
-                    atom += self._info.dependencies[name]
-
-                # the octave-forge packages will be put inside a "fake"
-                # category: g-octave
-                else:
-                    atom += 'g-octave/' + str(name)
-
-                # append the version to the atom, if needed
-                if comparator is not None and version is not None:
-                    atom += '-' + str(version)
-
-                depends_list.append(atom)
-
-            # invalid dependency atom
-            else:
-                log.error('Invalid dependency atom: %s' % depend)
-                raise GOctaveError('Invalid dependency atom: %s' % depend)
-
-        return list(set(depends_list))
+        return self._atoms(self._translate_depends(depends))
 
 
     def _parse_self_depends(self, depends):
         """returns a list of tuples (name, comparator, version) for the
         other octave-forge packages.
         """
-
-        # the list that will be returned
-        depends_list = list()
-
-        for depend in depends.split(','):
-
-            # use the 're_depends' regular expression to filter the
-            # package name, the version an the comparator
-            re_match = re_depends.match(depend.strip())
-
-            # the depend is valid?
-            if re_match is not None:
-
-                # extract the needed values
-                name = re_match.group(1)
-                comparator = re_match.group(3)
-                version = re_match.group(4)
-
-                # we need only the octave-forge packages, nor octave
-                if name.lower() != 'octave':
-                    depends_list.append((name, comparator, version))
-
-            # invalid dependency atom
-            else:
-                log.error('Invalid dependency atom: %s' % depend)
-                raise GOctaveError('Invalid dependency atom: %s' % depend)
-
-        return depends_list
+        return [i[1] for i in self._translate_depends(depends) \
+            if i[1] is not None]
 
 
     def sha1sum(self):
@@ -290,17 +324,23 @@ class Description(object):
         """method that overloads the object atributes, returning the needed
         atribute based on the dict with the previously parsed content.
         """
-        if name in ['depends', 'buildrequires', 'systemrequirements']:
-            return self._desc.get(name, [])
+        if name.startswith('_'):
+            raise AttributeError(name)
+        if name in self._lists:
+            value = self._desc.get(name, [])
+            if isinstance(value, tuple):
+                return list(value)
+            return value
         return self._desc.get(name, None)
 
 
 class SvnDescription(Description):
 
+    __slots__ = ()
+
     _url = 'https://octave.svn.sourceforge.net/svnroot/octave/trunk/octave-forge'
 
     def __init__(self, category, package):
-        temp_desc = tempfile.mkstemp()[1]
         desc_url = '%s/%s/%s/DESCRIPTION' % (
             self._url,
             category,
@@ -308,13 +348,11 @@ class SvnDescription(Description):
         )
         try:
             with closing(urllib.urlopen(desc_url)) as fp:
-                with open(temp_desc, 'wb') as fp_:
-                    shutil.copyfileobj(fp, fp_)
+                source = fp.read()
         except:
             raise GOctaveError('Failed to fetch DESCRIPTION file from SVN')
-        Description.__init__(self, temp_desc)
+        Description.__init__(self, desc_url, source=source)
         self.PN = package
         self.PV = '9999'
         self.P = '%s-%s' % (self.PN, self.PV)
         self.CAT = category
-        os.unlink(temp_desc)
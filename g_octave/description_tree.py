@@ -14,15 +14,29 @@
 
 from __future__ import absolute_import
 
-__all__ = ['DescriptionTree']
+__all__ = [
+    'DescriptionTree',
+    'FILTER_FIELDS',
+    'overlaps',
+    'satisfies',
+    'split_atom',
+]
 
+import fnmatch
 import glob
+import json
+import operator
 import os
 import re
 
+from . import database
+from .checksum import sha1_compute
+from .compat import intern
 from .config import Config
-from .description import Description
+from .description import Description, re_desc_file, re_pkg_atom
+from .exception import GOctaveError
 from .log import Log
+from .search_index import SearchIndex, re_plain_term
 from portage.versions import vercmp
 
 log = Log('g_octave.description_tree')
@@ -52,28 +66,442 @@ def cmp_to_key(mycmp):
     return K
 
 
+# comparators of the octave-forge dependencies
+_comparators = {
+    '>': operator.gt,
+    '>=': operator.ge,
+    '<': operator.lt,
+    '<=': operator.le,
+    '=': operator.eq,
+    '==': operator.eq,
+}
+
+# gentoo atoms, as returned by Description.depends: (comparator, catpkg, version)
+re_atom = re.compile(r'^([<>]?=?)([^<>=].*?)(-([0-9.]+))?$')
+
+# version constraints of the filters, like '>=1.0.0'
+re_constraint = re.compile(r'^([<>]?=?=?) *([0-9.]+)$')
+
+# the fields that can be used by DescriptionTree.filter
+FILTER_FIELDS = [
+    'category',
+    'license',
+    'depends',
+    'buildrequires',
+    'systemrequirements',
+    'version',
+]
+
+def split_atom(atom):
+    '''returns a tuple (comparator, catpkg, version) for a gentoo atom like
+    '>=sci-mathematics/octave-3.2.0'. The comparator and the version are
+    None for atoms without version.'''
+    match = re_atom.match(atom)
+    if match is None or match.group(1) == '' or match.group(4) is None:
+        return None, atom, None
+    return match.group(1), match.group(2), match.group(4)
+
+def _stat(path):
+    # used to detect the modified files and directories
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime, st.st_size
+
+def _manifest(db_dir):
+    # P -> SHA1 checksum of the DESCRIPTION file, or None if not available
+    try:
+        with open(os.path.join(db_dir, 'manifest.json')) as fp:
+            return json.load(fp)
+    except (IOError, ValueError):
+        return None
+
+def _sha1(path):
+    try:
+        return sha1_compute(path)
+    except IOError:
+        return None
+
+def satisfies(pv, comparator, version):
+    '''checks if the version 'pv' satisfies a dependency constraint, as
+    returned by Description.self_depends.'''
+    if comparator in [None, ''] or version is None:
+        return True
+    return _comparators[comparator](vercmp(pv, version), 0)
+
+def _bounds(comparator, version):
+    # the range of versions allowed by a constraint: a tuple with the lower
+    # and the upper bounds, as (version, inclusive) or None if unbounded
+    if comparator in [None, ''] or version is None:
+        return None, None
+    # '3.2' and '3.2.0' are the same version here
+    while version.endswith('.0'):
+        version = version[:-2]
+    if comparator in ['=', '==']:
+        return (version, True), (version, True)
+    if comparator.startswith('>'):
+        return (version, comparator == '>='), None
+    return None, (version, comparator == '<=')
+
+def overlaps(comparator1, version1, comparator2, version2):
+    '''checks if there's some version that satisfies both constraints, like
+    '>=3.0.0' and '<3.2'. The versions that differ only by trailing zeros,
+    like '3.2' and '3.2.0', are considered equal.'''
+    lower1, upper1 = _bounds(comparator1, version1)
+    lower2, upper2 = _bounds(comparator2, version2)
+    # the highest lower bound and the lowest upper bound
+    lower = upper = None
+    for bound in [lower1, lower2]:
+        if bound is None:
+            continue
+        if lower is None or vercmp(bound[0], lower[0]) > 0:
+            lower = bound
+        elif vercmp(bound[0], lower[0]) == 0:
+            lower = (lower[0], lower[1] and bound[1])
+    for bound in [upper1, upper2]:
+        if bound is None:
+            continue
+        if upper is None or vercmp(bound[0], upper[0]) < 0:
+            upper = bound
+        elif vercmp(bound[0], upper[0]) == 0:
+            upper = (upper[0], upper[1] and bound[1])
+    if lower is None or upper is None:
+        return True
+    result = vercmp(lower[0], upper[0])
+    return result < 0 or (result == 0 and lower[1] and upper[1])
+
+
 class DescriptionTree(list):
 
-    def __init__(self, parse_sysreq=True):
-        log.info('Parsing the package database.')
+    def __init__(self, parse_sysreq=True, lazy=False, db=None):
+        # lazy: don't parse anything now. The categories and packages are
+        # loaded when needed by the queries.
+        # db: the directory of the package database. The current generation
+        # is used by default, and followed by refresh.
         list.__init__(self)
+        self._follow_current = db is None
+        # shared lock, to keep the generation while we use it
+        if db is None:
+            self.db_dir, self._hold = database.hold_current()
+        else:
+            self.db_dir, self._hold = db, database.hold(db)
         self._categories = [i.strip() for i in config.categories.split(',')]
-        for my_file in glob.glob(os.path.join(config.db, 'octave-forge', \
-                                              '**', '**', '*.DESCRIPTION')):
-            description = Description(my_file, parse_sysreq=parse_sysreq)
-            if description.CAT in self._categories:
-                self.append(description)
+        self._parse_sysreq = parse_sysreq
+        self._lazy = lazy
+
+        # categories and packages (PN) already loaded (or looked up)
+        self._loaded_categories = set()
+        self._loaded_packages = set()
+
+        # indexes, updated by _add:
+        #   P -> Description object
+        self._packages = {}
+        #   PN -> list of PV, always sorted with vercmp
+        self._versions = {}
+        #   CAT -> set of PN
+        self._names = {}
+        #   PN -> P -> list of tuples (comparator, version), with the packages
+        #   that depend on it and their version constraints
+        self._rdeps = {}
+        #   field -> value -> set of P, for the 'category' and 'license'
+        #   filters, and field -> catpkg -> P -> tuple of tuples (comparator,
+        #   version) for the dependency filters
+        self._fields = dict([(i, {}) for i in FILTER_FIELDS if i != 'version'])
+
+        # built lazily, by the search_index property
+        self._search_index = None
+
+        # used by refresh: path of the loaded files and directories -> stat
+        self._stats = {}
+        self._info_stat = _stat(self._info_file())
+
+        if not lazy:
+            self.load_all()
+
+    def _category_dir(self, category):
+        return os.path.join(self.db_dir, 'octave-forge', category)
+
+    def _info_file(self):
+        return os.path.join(self.db_dir, 'info.json')
+
+    def _load_package_dir(self, category, pn):
+        self._loaded_packages.add(pn)
+        pkg_dir = os.path.join(self._category_dir(category), pn)
+        self._stats[pkg_dir] = _stat(pkg_dir)
+        for my_file in glob.glob(os.path.join(pkg_dir, '*.DESCRIPTION')):
+            self._load_file(my_file)
+        self._search_index = None
+
+    def _load_file(self, my_file):
+        self._stats[my_file] = _stat(my_file)
+        self._add(Description(my_file, parse_sysreq=self._parse_sysreq,
+            db=self.db_dir))
+
+    def load_category(self, category):
+        '''loads all the packages of a category, if not loaded yet. Only the
+        configured categories are loaded.'''
+        if category in self._loaded_categories or \
+          category not in self._categories:
+            return
+        log.info('Loading category: %s' % category)
+        category_dir = self._category_dir(category)
+        self._stats[category_dir] = _stat(category_dir)
+        if os.path.isdir(category_dir):
+            for pn in sorted(os.listdir(category_dir)):
+                if pn not in self._loaded_packages:
+                    self._load_package_dir(category, pn)
+        self._loaded_categories.add(category)
+
+    def load_all(self):
+        '''loads all the configured categories, if not loaded yet.'''
+        if len(self._loaded_categories) == len(self._categories):
+            return
+        log.info('Parsing the package database.')
+        for category in self._categories:
+            self.load_category(category)
+
+    def load_package(self, pn, closure=False):
+        '''loads all the versions of a package, if not loaded yet, without
+        loading the rest of its category. If 'closure' is True, all the
+        packages it depends on are loaded too, recursively. Returns False
+        if the package wasn't found.'''
+        to_load = [pn]
+        visited = set()
+        while len(to_load) > 0:
+            name = to_load.pop()
+            visited.add(name)
+            self._load_package(name)
+            if not closure:
+                continue
+            for pv in self._versions.get(name, []):
+                for dep in self._packages['%s-%s' % (name, pv)].self_depends:
+                    if dep[0] not in visited:
+                        to_load.append(dep[0])
+        return pn in self._versions
+
+    def _load_package(self, pn):
+        if pn in self._loaded_packages:
+            return
+        self._loaded_packages.add(pn)
+        for category in self._categories:
+            # the package would be already loaded
+            if category in self._loaded_categories:
+                continue
+            if os.path.isdir(os.path.join(self._category_dir(category), pn)):
+                self._load_package_dir(category, pn)
+                return
+
+    def refresh(self, files=None):
+        '''updates the tree with the DESCRIPTION files added, removed or
+        modified since they were loaded, re-parsing only these files and
+        updating the indexes in place. 'files' is an optional list with the
+        paths of the changed files (e.g. from a sync), to avoid looking for
+        changes on the whole database. Only the loaded categories and
+        packages are refreshed. Returns a dict with the lists of P 'added',
+        'removed' and 'changed'.'''
+        changes = dict(added=[], removed=[], changed=[])
+
+        if self._follow_current and database.path() != self.db_dir:
+            db_dir, hold = database.hold_current()
+            if db_dir != self.db_dir:
+                self._switch_generation(db_dir, hold)
+                files = None
+            elif hold is not None:
+                hold.release()
+
+        # the dependencies must be translated again if info.json changed
+        force = False
+        info_stat = _stat(self._info_file())
+        if info_stat != self._info_stat:
+            self._info_stat = info_stat
+            force = True
+            files = None
+
+        if files is None:
+            files = self._changed_files()
+        else:
+            files = [os.path.join(self.db_dir, i) for i in files]
+
+        affected = set()
+        for my_file in set(files):
+            change = self._refresh_file(my_file, force)
+            if change is not None:
+                changes[change[0]].append(change[1])
+                affected.add(change[2])
+
+        # the packages not found before can be available now
+        self._loaded_packages = set([i for i in self._loaded_packages \
+            if i in self._versions])
+
+        if self._search_index is not None:
+            for pn in affected:
+                self._search_index.remove(pn)
+                if pn in self._versions:
+                    self._search_index.add(self.get('%s-%s' % (pn, self._versions[pn][-1])))
+
+        for key in changes:
+            changes[key].sort()
+        if len(affected) > 0:
+            log.info('Package database refreshed: %r' % changes)
+        return changes
+
+    def _switch_generation(self, db_dir, hold):
+        # moves the tree to another generation of the package database. The
+        # files whose checksum didn't change in the manifest keep their
+        # Description objects, the others are re-parsed by refresh.
+        log.info('Switching to the generation: %s' % db_dir)
+        old_dir = self.db_dir
+        old_manifest, new_manifest = _manifest(old_dir), _manifest(db_dir)
+        same_info = _sha1(os.path.join(old_dir, 'info.json')) == \
+            _sha1(os.path.join(db_dir, 'info.json'))
+
+        if self._hold is not None:
+            self._hold.release()
+        self._hold = hold
+        self.db_dir = db_dir
+
+        # the directories are scanned again, to find the new files
+        self._stats = {}
+        for description in list.__iter__(self):
+            description._file = os.path.join(db_dir,
+                os.path.relpath(description._file, old_dir))
+            p = description.P
+            if same_info and old_manifest is not None and \
+              new_manifest is not None and p in old_manifest and \
+              old_manifest[p] == new_manifest.get(p):
+                self._stats[description._file] = _stat(description._file)
+        self._info_stat = _stat(self._info_file())
+
+    def _changed_files(self):
+        # the loaded files, and the files on the modified directories
+        files = set([i._file for i in list.__iter__(self)])
+        dirs = []
+        for category in self._loaded_categories:
+            category_dir = self._category_dir(category)
+            if _stat(category_dir) != self._stats.get(category_dir):
+                self._stats[category_dir] = _stat(category_dir)
+                if os.path.isdir(category_dir):
+                    dirs += [os.path.join(category_dir, i) for i in os.listdir(category_dir)]
+        for category in self._categories:
+            for pn in self._names.get(category, []):
+                dirs.append(os.path.join(self._category_dir(category), pn))
+        for pkg_dir in set(dirs):
+            if _stat(pkg_dir) != self._stats.get(pkg_dir):
+                self._stats[pkg_dir] = _stat(pkg_dir)
+                files.update(glob.glob(os.path.join(pkg_dir, '*.DESCRIPTION')))
+        return files
+
+    def _refresh_file(self, my_file, force=False):
+        # returns a tuple (change, P, PN), or None if nothing changed
+        match = re_desc_file.match(os.path.basename(my_file))
+        if match is None:
+            return None
+        p, pn = match.group(1), match.group(2)
+        category = os.path.basename(os.path.dirname(os.path.dirname(my_file)))
+        if category not in self._categories:
+            return None
+        if category not in self._loaded_categories and pn not in self._loaded_packages:
+            # not loaded yet, will be loaded when needed
+            return None
+        old = self._packages.get(p)
+        stat = _stat(my_file)
+        if stat is None:
+            if old is None:
+                return None
+            self._remove(old)
+            return 'removed', p, pn
+        if old is not None:
+            if not force and stat == self._stats.get(my_file):
+                return None
+            self._remove(old)
+        self._load_file(my_file)
+        return (old is None and 'added' or 'changed'), p, pn
+
+    def _ensure_package(self, pn):
+        if self._lazy and pn not in self._loaded_packages:
+            self.load_package(pn)
+
+    def _ensure_all(self):
+        if self._lazy:
+            self.load_all()
+
+    def __iter__(self):
+        self._ensure_all()
+        return list.__iter__(self)
+
+    def __len__(self):
+        self._ensure_all()
+        return list.__len__(self)
+
+    def _add(self, description):
+        self.append(description)
+        self._packages[description.P] = description
+        versions = self._versions.setdefault(description.PN, [])
+        versions.append(description.PV)
+        versions.sort(key=cmp_to_key(vercmp))
+        self._names.setdefault(description.CAT, set()).add(description.PN)
+        for pn, comparator, version in description.self_depends:
+            self._rdeps.setdefault(pn, {}).setdefault(description.P, []).append(
+                (comparator, version)
+            )
+        self._index_fields(description)
+
+    def _remove(self, description):
+        # the opposite of _add
+        list.remove(self, description)
+        p, pn = description.P, description.PN
+        del self._packages[p]
+        versions = self._versions[pn]
+        versions.remove(description.PV)
+        if len(versions) == 0:
+            del self._versions[pn]
+            self._names[description.CAT].discard(pn)
+        for dep in description.self_depends:
+            rdeps = self._rdeps.get(dep[0], {})
+            rdeps.pop(p, None)
+            if len(rdeps) == 0:
+                self._rdeps.pop(dep[0], None)
+        for field, key in [('category', description.CAT),
+                           ('license', description.license_gentoo)]:
+            self._fields[field][key].discard(p)
+            if len(self._fields[field][key]) == 0:
+                del self._fields[field][key]
+        for field, atom in self._dependency_fields(description):
+            catpkg = split_atom(atom)[1]
+            constraints = self._fields[field].get(catpkg, {})
+            constraints.pop(p, None)
+            if len(constraints) == 0:
+                self._fields[field].pop(catpkg, None)
+        self._stats.pop(description._file, None)
+
+    def _dependency_fields(self, description):
+        # yields tuples (field, catpkg), for the dependency filters
+        for field in ['depends', 'buildrequires', 'systemrequirements']:
+            atoms = getattr(description, field)
+            # not parsed, with parse_sysreq=False
+            if not isinstance(atoms, list):
+                continue
+            for atom in atoms:
+                yield field, atom
+
+    def _index_fields(self, description):
+        p = description.P
+        self._fields['category'].setdefault(description.CAT, set()).add(p)
+        self._fields['license'].setdefault(description.license_gentoo, set()).add(p)
+        for field, atom in self._dependency_fields(description):
+            comparator, catpkg, version = [i is not None and intern(i) or None \
+                for i in split_atom(atom)]
+            constraints = self._fields[field].setdefault(catpkg, {})
+            constraints[p] = constraints.get(p, ()) + ((comparator, version),)
 
     def package_versions(self, pn):
-        tmp = []
-        for pkg in self:
-            if pkg.PN == pn:
-                tmp.append(pkg.PV)
-        tmp.sort(key=cmp_to_key(vercmp))
-        return tmp
+        self._ensure_package(pn)
+        return self._versions.get(pn, [])[:]
 
     def latest_version(self, pn):
-        tmp = self.package_versions(pn)
+        self._ensure_package(pn)
+        tmp = self._versions.get(pn, [])
         return (len(tmp) > 0) and tmp[-1] or None
 
     def latest_version_from_list(self, pv_list):
@@ -81,31 +509,157 @@ class DescriptionTree(list):
         tmp.sort(key=cmp_to_key(vercmp))
         return (len(tmp) > 0) and tmp[-1] or None
 
+    @property
+    def search_index(self):
+        '''the SearchIndex object, with the latest version of each package.'''
+        if self._search_index is None:
+            self._ensure_all()
+            self._search_index = SearchIndex()
+            for pkg, versions in self.walk():
+                self._search_index.add(pkg)
+        return self._search_index
+
     def search(self, term):
-        # term can be a regular expression
+        return dict(self.search_results(term))
+
+    def search_results(self, term):
+        '''returns a list of tuples (PN, versions). Plain words are searched
+        on the metadata of the packages, and the results are ordered by
+        relevance. Any other term is a regular expression, matched against
+        the package names, and the results are ordered by name.'''
+        if re_plain_term.match(term) is not None:
+            return [(pn, self._versions[pn][:]) for pn, score in \
+                self.search_index.search(term)]
         re_term = re.compile(r'%s' % term)
-        packages = {}
-        for pkg in self:
-            if re_term.search(pkg.PN) is not None:
-                if pkg.PN not in packages:
-                    packages[pkg.PN] = []
-                packages[pkg.PN].append(pkg.PV)
-                packages[pkg.PN].sort(key=cmp_to_key(vercmp))
+        candidates = self.search_index.candidates(term)
+        if candidates is None:
+            candidates = self._versions
+        return [(pn, self._versions[pn][:]) for pn in sorted(candidates) \
+            if re_term.search(pn) is not None]
+
+    def walk(self, term=None):
+        '''generator that yields a tuple (Description, versions) for each
+        package, with the Description object of the latest version and the
+        list of available versions, ordered by category and name. 'term' is
+        an optional regular expression to filter the package names.'''
+        re_term = term is not None and re.compile(r'%s' % term) or None
+        for category in self._categories:
+            self.load_category(category)
+            for pn in sorted(self._names.get(category, [])):
+                if re_term is not None and re_term.search(pn) is None:
+                    continue
+                versions = self._versions[pn]
+                yield self.get('%s-%s' % (pn, versions[-1])), versions[:]
+
+    def _filter_field(self, field, value):
+        index = self._fields[field]
+        if field in ['category', 'license']:
+            packages = set()
+            for key in fnmatch.filter(index, value):
+                packages |= index[key]
+            return packages
+
+        # dependencies: the value is a gentoo atom, and its version range
+        # (if any) must overlap the range required by the packages.
+        comparator, catpkg, version = split_atom(value)
+        packages = set()
+        for key in fnmatch.filter(index, catpkg):
+            for p, constraints in index[key].items():
+                for _comparator, _version in constraints:
+                    if overlaps(_comparator, _version, comparator, version):
+                        packages.add(p)
+                        break
         return packages
 
+    def filter(self, **criteria):
+        '''returns a sorted list with the P of the packages that match all the
+        criteria. The keyword arguments are the fields of FILTER_FIELDS, and
+        the values are strings or lists of strings (all of them must match):
+
+        - category, license: the category and the gentoo license, shell-style
+          wildcards allowed (e.g. 'GPL*').
+        - depends, buildrequires, systemrequirements: a gentoo atom (wildcards
+          allowed on the name) of a dependency. With a version, like
+          '>=sci-mathematics/octave-3.2', only the packages that can use
+          some version that satisfies it match: a package requiring
+          '>=3.0.0' matches, a package requiring '<3.2.0' doesn't.
+        - version: a version constraint like '>=1.0.0', or a single version.
+        '''
+        if self._lazy:
+            # only the categories that can match are needed
+            categories = self._categories
+            values = criteria.get('category', '*')
+            for value in isinstance(values, (list, tuple)) and values or [values]:
+                categories = fnmatch.filter(categories, value)
+            for category in categories:
+                self.load_category(category)
+        packages = None
+        constraints = []
+        for field in criteria:
+            if field not in FILTER_FIELDS:
+                raise GOctaveError('Invalid filter: %s' % field)
+            values = criteria[field]
+            if not isinstance(values, (list, tuple)):
+                values = [values]
+            for value in values:
+                if field == 'version':
+                    match = re_constraint.match(value.strip())
+                    if match is None:
+                        raise GOctaveError('Invalid version constraint: %s' % value)
+                    constraints.append((match.group(1) or '=', match.group(2)))
+                    continue
+                matches = self._filter_field(field, value)
+                if packages is None:
+                    packages = matches
+                else:
+                    packages &= matches
+        if packages is None:
+            packages = self._packages
+        key = cmp_to_key(vercmp)
+        return sorted([p for p in packages if self._satisfies_all(p, constraints)],
+            key=lambda p: (self._packages[p].PN, key(self._packages[p].PV)))
+
+    def _satisfies_all(self, p, constraints):
+        for comparator, version in constraints:
+            if not satisfies(self._packages[p].PV, comparator, version):
+                return False
+        return True
+
     def list(self):
         packages = {}
         for category in self._categories:
             packages[category] = {}
         for pkg in self:
             if pkg.PN not in packages[pkg.CAT]:
-                packages[pkg.CAT][pkg.PN] = []
-            packages[pkg.CAT][pkg.PN].append(pkg.PV)
-            packages[pkg.CAT][pkg.PN].sort(key=cmp_to_key(vercmp))
+                packages[pkg.CAT][pkg.PN] = self._versions[pkg.PN][:]
         return packages
 
+    def reverse_dependencies(self, pkg_atom):
+        '''returns a sorted list with the P of the packages that depend on a
+        package. For an atom like 'control' all the packages depending on
+        any version are returned. For an atom like 'control-1.0.11' (that
+        doesn't need to be available yet) only the packages whose version
+        constraints are all satisfied by this version are returned.'''
+        self._ensure_all()
+        atom = re_pkg_atom.match(pkg_atom)
+        if atom is None:
+            return sorted(set(self._rdeps.get(pkg_atom, {})))
+        pn, pv = atom.groups()
+        rdeps = self._rdeps.get(pn, {})
+        return sorted([p for p in rdeps if all([satisfies(pv, comparator, version) \
+            for comparator, version in rdeps[p]])])
+
     def get(self, p):
-        for pkg in self:
-            if pkg.P == p:
-                return pkg
-        return None
+        if self._lazy and p not in self._packages:
+            atom = re_pkg_atom.match(p)
+            if atom is not None:
+                self._ensure_package(atom.group(1))
+        return self._packages.get(p, None)
+
+    def lookup(self, pkg_atom):
+        '''returns the Description object for an atom like 'control' (the
+        latest version) or 'control-1.0.11', or None if not found.'''
+        atom = re_pkg_atom.match(pkg_atom)
+        if atom is None:
+            return self.get('%s-%s' % (pkg_atom, self.latest_version(pkg_atom)))
+        return self.get(pkg_atom)
@@ -16,15 +16,23 @@ from __future__ import absolute_import
 __all__ = [
     'Ebuild',
     're_keywords',
+    'fingerprint',
+    'list_patches',
+    'load_fingerprints',
+    'save_fingerprints',
 ]
 
 from .config import Config
 from .description import *
 from .description_tree import DescriptionTree
 from .exception import GOctaveError
+from .lock import overlay_lock, package_lock
+from .metadata import update_md5_cache
 from .compat import open
 
 import getpass
+import hashlib
+import json
 import os
 import portage
 import re
@@ -78,25 +86,68 @@ METADATA_TEMPLATE = """\
 </pkgmetadata>
 """
 
+# file, inside of the package directory on the overlay, with the fingerprints
+# of the ebuilds generated for the package
+FINGERPRINTS_FILE = '.fingerprints'
+
+
+def list_patches(p, db_dir):
+    '''Returns a sorted list with the names of the patches of the package
+    on the package database.'''
+    patches_dir = os.path.join(db_dir, 'patches')
+    if not os.path.exists(patches_dir):
+        return []
+    tmp = []
+    for patch in os.listdir(patches_dir):
+        if re.match(r'^([0-9]{3})_' + p, patch):
+            tmp.append(patch)
+    tmp.sort()
+    return tmp
+
+
+def fingerprint(description, db_dir):
+    '''Returns a checksum of everything that is used to generate the ebuild
+    of the package: the DESCRIPTION file and the names of the patches.'''
+    checksum = hashlib.sha1(description.sha1sum().encode('utf-8'))
+    for patch in list_patches(description.P, db_dir):
+        checksum.update(patch.encode('utf-8'))
+    return checksum.hexdigest()
+
+
+def load_fingerprints(pn):
+    '''Returns a dict (P -> fingerprint) with the fingerprints recorded when
+    the ebuilds of the package were created.'''
+    fingerprints_file = os.path.join(config.overlay, 'g-octave', pn, FINGERPRINTS_FILE)
+    if not os.path.exists(fingerprints_file):
+        return {}
+    try:
+        with open(fingerprints_file) as fp:
+            return json.load(fp)
+    except:
+        return {}
+
+
+def save_fingerprints(pn, fingerprints):
+    '''Saves the dict (P -> fingerprint) with the fingerprints of the ebuilds
+    of the package.'''
+    fingerprints_file = os.path.join(config.overlay, 'g-octave', pn, FINGERPRINTS_FILE)
+    with open(fingerprints_file, 'w') as fp:
+        json.dump(fingerprints, fp, indent=2, sort_keys=True)
+
 
 class Ebuild:
 
-    def __init__(self, pkg_atom, force=False, scm=False, pkg_manager=None):
+    def __init__(self, pkg_atom, force=False, scm=False, pkg_manager=None, tree=None):
 
         self._scm = scm
         self._force = force
         self._pkg_manager = pkg_manager
-        self._tree = DescriptionTree()
-
-        atom = re_pkg_atom.match(pkg_atom)
-        if atom is None:
-            pkg_name = pkg_atom
-            version = self._tree.latest_version(pkg_name)
-        else:
-            pkg_name = atom.group(1)
-            version = atom.group(2)
+        if tree is None:
+            # only the package and its dependencies will be loaded
+            tree = DescriptionTree(lazy=True)
+        self._tree = tree
 
-        self.description = self._tree.get('%s-%s' % (pkg_name, version))
+        self.description = self._tree.lookup(pkg_atom)
         if self._scm:
             if self.description is not None:
                 self.description = SvnDescription(self.description.CAT, self.description.PN)
@@ -107,6 +158,15 @@ class Ebuild:
             raise GOctaveError('Package not found: %s' % pkg_atom)
 
     def create(self, display_info=True, accept_keywords=None, manifest=True, nodeps=False):
+        # the package directory is locked only while its files are written,
+        # the dependencies are created with their own locks.
+        with overlay_lock():
+            with package_lock(self.description.PN):
+                created = self._create(display_info, accept_keywords, manifest)
+        if created and not nodeps:
+            self._resolve_dependencies()
+
+    def _create(self, display_info, accept_keywords, manifest):
         ebuild_dir = os.path.join(config.overlay, 'g-octave', self.description.PN)
         ebuild_file = os.path.join(ebuild_dir, self.description.P + '.ebuild')
         metadata_file = os.path.join(ebuild_dir, 'metadata.xml')
@@ -114,27 +174,39 @@ class Ebuild:
         if self._force and os.path.exists(ebuild_dir):
             shutil.rmtree(ebuild_dir)
 
-        if not os.path.exists(ebuild_file) or self._force:
+        if os.path.exists(ebuild_file) and not self._force:
+            return False
+
+        if display_info:
+            out.einfo('Creating ebuild: g-octave/' + self.description.P + '.ebuild')
+        try:
+            if not os.path.exists(ebuild_dir):
+                os.makedirs(ebuild_dir, 0o755)
+            ebuild_vars = self._evaluate_ebuild_vars(accept_keywords)
+            with open(ebuild_file, 'w') as fp:
+                fp.write(EBUILD_TEMPLATE % ebuild_vars)
+            if not self._scm:
+                self._save_fingerprint()
+            update_md5_cache(self.description, ebuild_file)
+            if not os.path.exists(metadata_file):
+                with open(metadata_file, 'w') as fp:
+                    fp.write(METADATA_TEMPLATE % self._evaluate_metadata_vars())
+            if manifest:
+                if self._pkg_manager.create_manifest(ebuild_file) != os.EX_OK:
+                    raise GOctaveError('Failed to create Manifest file!')
+        except Exception as error:
             if display_info:
-                out.einfo('Creating ebuild: g-octave/' + self.description.P + '.ebuild')
-            try:
-                if not os.path.exists(ebuild_dir):
-                    os.makedirs(ebuild_dir, 0o755)
-                with open(ebuild_file, 'w') as fp:
-                    fp.write(EBUILD_TEMPLATE % self._evaluate_ebuild_vars(accept_keywords))
-                if not os.path.exists(metadata_file):
-                    with open(metadata_file, 'w') as fp:
-                        fp.write(METADATA_TEMPLATE % self._evaluate_metadata_vars())
-                if manifest:
-                    if self._pkg_manager.create_manifest(ebuild_file) != os.EX_OK:
-                        raise GOctaveError('Failed to create Manifest file!')
-            except Exception as error:
-                if display_info:
-                    out.eerror('Failed to create: g-octave/' + self.description.P + '.ebuild')
-                raise GOctaveError(error)
-            else:
-                if not nodeps:
-                    self._resolve_dependencies()
+                out.eerror('Failed to create: g-octave/' + self.description.P + '.ebuild')
+            raise GOctaveError(error)
+        return True
+
+    def fingerprint(self):
+        return fingerprint(self.description, self._tree.db_dir)
+
+    def _save_fingerprint(self):
+        fingerprints = load_fingerprints(self.description.PN)
+        fingerprints[self.description.P] = self.fingerprint()
+        save_fingerprints(self.description.PN, fingerprints)
 
     def _evaluate_ebuild_vars(self, accept_keywords=None):
         if accept_keywords is None:
@@ -201,20 +273,15 @@ class Ebuild:
 
     def _search_patches(self):
 
-        patches_dir = os.path.join(config.db, 'patches')
+        patches_dir = os.path.join(self._tree.db_dir, 'patches')
         files_dir = os.path.join(config.overlay, 'g-octave', self.description.PN, 'files')
 
-        if not os.path.exists(patches_dir):
-            return []
-
         tmp = []
-        for patch in os.listdir(patches_dir):
-            if re.match(r'^([0-9]{3})_' + self.description.P, patch):
-                if not os.path.exists(files_dir):
-                    os.makedirs(files_dir, 0o755)
-                shutil.copy2(os.path.join(patches_dir, patch), files_dir)
-                tmp.append('"${FILESDIR}/' + patch + '"')
-        tmp.sort()
+        for patch in list_patches(self.description.P, self._tree.db_dir):
+            if not os.path.exists(files_dir):
+                os.makedirs(files_dir, 0o755)
+            shutil.copy2(os.path.join(patches_dir, patch), files_dir)
+            tmp.append('"${FILESDIR}/' + patch + '"')
         return tmp
 
     def _resolve_dependencies(self):
@@ -236,11 +303,12 @@ class Ebuild:
                 if eval('%s %s 0' % (comparation, comp)):
                     allowed_versions.append(_version)
 
-            to_install.append('%s-%s' % (pkg, self._tree.version_compare(allowed_versions)))
-
             if len(allowed_versions) == 0:
                 raise GOctaveError('Can\'t resolve a dependency: %s' % pkg)
 
+            to_install.append('%s-%s' % (pkg, self._tree.latest_version_from_list(allowed_versions)))
+
         # creating the ebuilds for the dependencies, recursivelly
         for ebuild in to_install:
-            Ebuild(ebuild, force=self._force, pkg_manager=self._pkg_manager, scm=self._scm).create()
+            Ebuild(ebuild, force=self._force, pkg_manager=self._pkg_manager,
+                scm=self._scm, tree=self._tree).create()
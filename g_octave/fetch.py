@@ -20,6 +20,7 @@ __all__ = ['fetch']
 from .config import Config
 conf = Config()
 
+from . import database
 from .description_tree import DescriptionTree
 from .exception import GOctaveError
 from .compat import py3k, open as open_
@@ -40,14 +41,6 @@ import tarfile
 
 from contextlib import closing
 
-def clean_db():
-    for f in ['timestamp', 'info.json', 'patches', 'octave-forge', 'manifest.json']:
-        current = os.path.join(conf.db, f)
-        if os.path.isdir(current):
-            shutil.rmtree(current)
-        elif os.path.isfile(current):
-            os.unlink(current)
-
 class GitHub:
 
     re_db_mirror = re.compile(r'github://(?P<user>[^/]+)/(?P<repo>[^/]+)/?')
@@ -59,8 +52,10 @@ class GitHub:
         self.url = 'http://github.com'
 
     def need_update(self):
+        # the cache may be removed by a sync, but the package database is
+        # available until a new generation replaces it.
         return not os.path.exists(os.path.join(
-            conf.db, 'cache', 'commit_id'
+            database.path(), 'manifest.json'
         ))
 
     def get_commits(self, branch='master'):
@@ -106,7 +101,9 @@ class GitHub:
         return True
 
     def extract(self):
-        clean_db()
+        '''extracts the downloaded tarball to a new generation of the package
+        database, and returns its path (or None if there's nothing to
+        extract). The generation must be published after verified.'''
         cache = os.path.join(conf.db, 'cache')
         commit_id = os.path.join(cache, 'commit_id')
         tarball = None
@@ -116,17 +113,19 @@ class GitHub:
                     cache,
                     'octave-forge-%s.tar.gz' % fp.read().strip()
                 )
-        if tarball is not None:
-            if tarfile.is_tarfile(tarball):
-                with closing(tarfile.open(tarball, 'r')) as fp:
-                    fp.extractall(conf.db)
-                dirs = glob.glob('%s/%s-%s*' % (conf.db, self.user, self.repo))
-                if len(dirs) != 1:
-                    raise GOctaveError('Failed to extract the tarball.')
-                    return
-                for f in os.listdir(dirs[0]):
-                    shutil.move(os.path.join(dirs[0], f), conf.db)
-                os.rmdir(dirs[0])
+        if tarball is None or not tarfile.is_tarfile(tarball):
+            return None
+        gen, self._hold = database.new_generation()
+        with closing(tarfile.open(tarball, 'r')) as fp:
+            fp.extractall(gen)
+        dirs = glob.glob('%s/%s-%s*' % (gen, self.user, self.repo))
+        if len(dirs) != 1:
+            shutil.rmtree(gen)
+            raise GOctaveError('Failed to extract the tarball.')
+        for f in os.listdir(dirs[0]):
+            shutil.move(os.path.join(dirs[0], f), gen)
+        os.rmdir(dirs[0])
+        return gen
 
 # TODO: Implement gitweb support
 
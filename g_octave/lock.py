@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+
+"""
+    g_octave.lock
+    ~~~~~~~~~~~~~
+
+    This module implements the fcntl locks used to coordinate the g-octave
+    processes that share the package database and the overlay.
+
+    The readers take shared locks, and the writers take exclusive locks only
+    on what they change: a package directory of the overlay, or the whole
+    overlay when it is recreated.
+
+    :copyright: (c) 2010 by Rafael Goncalves Martins
+    :license: GPL-2, see LICENSE for more details.
+"""
+
+from __future__ import absolute_import
+
+__all__ = [
+    'Lock',
+    'locks_dir',
+    'overlay_lock',
+    'package_lock',
+]
+
+import errno
+import fcntl
+import os
+import time
+
+from .config import Config
+from .log import Log
+
+config = Config()
+log = Log('g_octave.lock')
+
+
+class Lock(object):
+
+    def __init__(self, path, exclusive=False, create=True):
+        # create: creates the lock file (and its directory) if needed.
+        # Otherwise, acquire fails if the file doesn't exists. Without
+        # 'create', the path may be a directory.
+        self.path = path
+        self.exclusive = exclusive
+        self._create = create
+        self._fd = None
+
+    @property
+    def locked(self):
+        return self._fd is not None
+
+    def _open(self):
+        # the locks are taken on file descriptors, that can be opened
+        # read-only and for directories
+        if not self._create:
+            return os.open(self.path, os.O_RDONLY)
+        lock_dir = os.path.dirname(self.path)
+        if not os.path.isdir(lock_dir):
+            try:
+                os.makedirs(lock_dir, 0o755)
+            except OSError as err:
+                if err.errno != errno.EEXIST:
+                    raise
+        return os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+    def acquire(self, blocking=True):
+        '''acquires the lock. Returns False if the lock is held by another
+        process and 'blocking' is False, or if the lock file doesn't exists
+        and can't be created.'''
+        if self.locked:
+            return True
+        flags = self.exclusive and fcntl.LOCK_EX or fcntl.LOCK_SH
+        while True:
+            try:
+                fd = self._open()
+            except OSError as err:
+                if err.errno == errno.ENOENT:
+                    return False
+                raise
+            try:
+                fcntl.flock(fd, flags | fcntl.LOCK_NB)
+            except IOError:
+                if not blocking:
+                    os.close(fd)
+                    return False
+                log.info('Waiting for the lock: %s' % self.path)
+                start = time.time()
+                fcntl.flock(fd, flags)
+                log.info('Lock acquired after %.3f seconds: %s' % \
+                    (time.time() - start, self.path))
+            # the lock file may be removed (e.g. with its directory) by the
+            # previous holder of the lock.
+            try:
+                if os.stat(self.path).st_ino == os.fstat(fd).st_ino:
+                    self._fd = fd
+                    return True
+            except OSError:
+                pass
+            os.close(fd)
+
+    def release(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+
+def locks_dir():
+    '''returns the directory of the lock files, inside the overlay.'''
+    return os.path.join(config.overlay, '.locks')
+
+def overlay_lock(exclusive=False):
+    '''returns the lock of the overlay. Everybody that uses the overlay takes
+    it shared, and it is taken exclusive only to recreate the overlay.'''
+    return Lock(os.path.join(locks_dir(), 'overlay'), exclusive)
+
+def package_lock(pn):
+    '''returns the exclusive lock of the directory of a package on the
+    overlay, taken to write its files.'''
+    return Lock(os.path.join(locks_dir(), 'g-octave', pn), True)
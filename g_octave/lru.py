@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+"""
+    g_octave.lru
+    ~~~~~~~~~~~~
+
+    This module implements a simple dict-like object that keeps only the
+    most recently used items, and counts the hits and misses of the lookups.
+    collections.OrderedDict isn't available on Python 2.6, so the order of
+    the items is kept by a circular doubly linked list.
+
+    :copyright: (c) 2010 by Rafael Goncalves Martins
+    :license: GPL-2, see LICENSE for more details.
+"""
+
+__all__ = ['LRUCache']
+
+# fields of the links: [previous, next, key, value]
+PREV, NEXT, KEY, VALUE = 0, 1, 2, 3
+
+
+class LRUCache(object):
+
+    def __init__(self, size=1024):
+        self.size = size
+        self.clear()
+
+    def clear(self):
+        '''removes all the items and resets the counters'''
+        self.hits = 0
+        self.misses = 0
+        # key -> link
+        self._links = {}
+        self._root = []
+        self._root[:] = [self._root, self._root, None, None]
+
+    def __len__(self):
+        return len(self._links)
+
+    def __contains__(self, key):
+        return key in self._links
+
+    def get(self, key, default=None):
+        '''returns the value of the key, marking it as the most recently used,
+        or 'default' if not found.'''
+        link = self._links.get(key)
+        if link is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self._unlink(link)
+        self._append(link)
+        return link[VALUE]
+
+    def __setitem__(self, key, value):
+        link = self._links.get(key)
+        if link is not None:
+            self._unlink(link)
+            link[VALUE] = value
+        else:
+            if len(self._links) >= self.size:
+                oldest = self._root[NEXT]
+                self._unlink(oldest)
+                del self._links[oldest[KEY]]
+            link = [None, None, key, value]
+            self._links[key] = link
+        self._append(link)
+
+    def _unlink(self, link):
+        link[PREV][NEXT] = link[NEXT]
+        link[NEXT][PREV] = link[PREV]
+
+    def _append(self, link):
+        last = self._root[PREV]
+        link[PREV] = last
+        link[NEXT] = self._root
+        last[NEXT] = link
+        self._root[PREV] = link
+
+    def stats(self):
+        '''returns a dict with the counters, for profiling'''
+        return dict(hits=self.hits, misses=self.misses, size=len(self))
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+
+"""
+    g_octave.metadata
+    ~~~~~~~~~~~~~~~~~
+
+    This module implements functions to maintain the metadata cache of the
+    overlay (metadata/md5-cache). The metadata of each ebuild is generated
+    by the package manager once, when g-octave creates the ebuild, so the
+    dependency resolution doesn't need to source the ebuilds and the
+    eclasses again.
+
+    :copyright: (c) 2010 by Rafael Goncalves Martins
+    :license: GPL-2, see LICENSE for more details.
+"""
+
+from __future__ import absolute_import
+
+__all__ = [
+    'md5_compute',
+    'eclasses',
+    'generate_metadata',
+    'md5_cache_entry',
+    'update_md5_cache',
+    'remove_md5_cache',
+]
+
+import hashlib
+import os
+
+from .config import Config
+from .compat import open as open_
+
+config = Config()
+
+# keys of the metadata stored on the md5-cache entries
+METADATA_KEYS = [
+    'DEFINED_PHASES', 'DEPEND', 'DESCRIPTION', 'EAPI', 'HOMEPAGE', 'IUSE',
+    'KEYWORDS', 'LICENSE', 'PDEPEND', 'PROPERTIES', 'RDEPEND', 'RESTRICT',
+    'SLOT', 'SRC_URI',
+]
+
+# MD5 checksums of the eclasses: path -> (mtime, checksum)
+_eclass_checksums = {}
+
+
+def md5_compute(filename):
+    '''Computes the MD5 checksum of a file'''
+    with open(filename, 'rb') as fp:
+        return hashlib.md5(fp.read()).hexdigest()
+
+
+def _eclass_file(name, portdir):
+    if name == 'g-octave':
+        return os.path.join(config.overlay, 'eclass', 'g-octave.eclass')
+    return os.path.join(portdir, 'eclass', name + '.eclass')
+
+
+def eclasses(names, portdir=None):
+    '''returns a dict (eclass name -> MD5 checksum) with the eclasses, or
+    None if some of them wasn't found. The checksums are cached until the
+    mtime of the eclass changes.'''
+    if portdir is None:
+        import portage
+        portdir = portage.settings.get('PORTDIR', '/usr/portage')
+    checksums = {}
+    for name in names:
+        eclass_file = _eclass_file(name, portdir)
+        try:
+            mtime = os.stat(eclass_file).st_mtime
+        except OSError:
+            return None
+        cached = _eclass_checksums.get(eclass_file)
+        if cached is None or cached[0] != mtime:
+            cached = (mtime, md5_compute(eclass_file))
+            _eclass_checksums[eclass_file] = cached
+        checksums[name] = cached[1]
+    return checksums
+
+
+def generate_metadata(p):
+    '''sources the ebuild of the package (and its eclasses) with the package
+    manager, and returns a dict with its metadata (METADATA_KEYS and
+    INHERITED), or None if it failed.'''
+    import portage
+    keys = METADATA_KEYS + ['INHERITED']
+    try:
+        values = portage.portdb.aux_get('g-octave/' + p, keys, mytree=config.overlay)
+    except (KeyError, portage.exception.PortageException):
+        return None
+    return dict(zip(keys, values))
+
+
+def md5_cache_entry(values, ebuild_file, eclasses):
+    '''returns the content of the md5-cache entry of an ebuild, from its
+    metadata (see generate_metadata).'''
+    metadata = dict([(i, ' '.join(values.get(i, '').split())) for i in METADATA_KEYS])
+    # DESCRIPTION is the only value where the spaces matter
+    metadata['DESCRIPTION'] = values.get('DESCRIPTION', '')
+    metadata['_eclasses_'] = '\t'.join(['%s\t%s' % (i, eclasses[i]) for i in sorted(eclasses)])
+    metadata['_md5_'] = md5_compute(ebuild_file)
+    lines = []
+    for key in sorted(metadata):
+        if metadata[key] not in [None, '']:
+            lines.append('%s=%s\n' % (key, metadata[key]))
+    return ''.join(lines)
+
+
+def _cache_file(p):
+    return os.path.join(config.overlay, 'metadata', 'md5-cache', 'g-octave', p)
+
+
+def update_md5_cache(description, ebuild_file, portdir=None, values=None):
+    '''creates/updates the md5-cache entry of an ebuild, with its metadata
+    (generated by the package manager, if not provided). Returns False if
+    the entry can't be created.'''
+    if values is None:
+        values = generate_metadata(description.P)
+    checksums = None
+    if values is not None:
+        checksums = eclasses(values.get('INHERITED', '').split(), portdir)
+    cache_file = _cache_file(description.P)
+    if checksums is None:
+        remove_md5_cache(description.P)
+        return False
+    cache_dir = os.path.dirname(cache_file)
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir, 0o755)
+    content = md5_cache_entry(values, ebuild_file, checksums)
+    with open_(cache_file + '.tmp', 'w') as fp:
+        fp.write(content)
+    os.rename(cache_file + '.tmp', cache_file)
+    return True
+
+
+def remove_md5_cache(p):
+    '''removes the md5-cache entry of an ebuild, if it exists.'''
+    cache_file = _cache_file(p)
+    if os.path.exists(cache_file):
+        os.unlink(cache_file)
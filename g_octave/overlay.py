@@ -13,23 +13,69 @@
 
 from __future__ import absolute_import
 
-__all__ = ['create_overlay']
+__all__ = [
+    'create_overlay',
+    'clean_overlay',
+]
 
 import os
+import re
 import sys
 import shutil
 import portage.output
 
 from .config import Config
+from .ebuild import load_fingerprints, save_fingerprints
+from .exception import GOctaveError
+from .lock import overlay_lock, package_lock, locks_dir
+from .metadata import remove_md5_cache
 from .compat import open
 
 config = Config()
 out = portage.output.EOutput()
 
+# pattern for ebuild filenames
+re_ebuild_file = re.compile(r'^((.+)-([0-9.]+))\.ebuild$')
+
+LAYOUT_CONF = """\
+masters = gentoo
+cache-formats = md5-dict
+"""
+
+def create_layout_conf():
+    layout_conf = os.path.join(config.overlay, 'metadata', 'layout.conf')
+    if not os.path.exists(layout_conf):
+        if not os.path.exists(os.path.dirname(layout_conf)):
+            os.makedirs(os.path.dirname(layout_conf), 0o755)
+        with open(layout_conf, 'w') as fp:
+            fp.write(LAYOUT_CONF)
+
 def create_overlay(force=False, quiet=False):
     
+    # the overlay is locked only to be created, and the other processes
+    # wait until it is ready.
+    if force or not os.path.exists(os.path.join(config.overlay, 'profiles', 'repo_name')):
+        with overlay_lock(exclusive=True):
+            _create_overlay(force, quiet)
+    
+    # the overlays created by older versions of g-octave doesn't have it
+    create_layout_conf()
+
+def _remove_overlay():
+    # the lock files are kept, they are used by the other processes
+    for _file in os.listdir(config.overlay):
+        if _file == os.path.basename(locks_dir()):
+            continue
+        current = os.path.join(config.overlay, _file)
+        if os.path.isdir(current) and not os.path.islink(current):
+            shutil.rmtree(current)
+        else:
+            os.unlink(current)
+
+def _create_overlay(force, quiet):
+    
     if force and os.path.exists(config.overlay):
-        shutil.rmtree(config.overlay)
+        _remove_overlay()
     
     if not os.path.exists(os.path.join(config.overlay, 'profiles', 'repo_name')):
         
@@ -78,3 +124,84 @@ def create_overlay(force=False, quiet=False):
         else:
             if not quiet:
                 out.eend(0)
+
+
+def _remove_ebuild(pkg_dir, p):
+    os.unlink(os.path.join(pkg_dir, p + '.ebuild'))
+    remove_md5_cache(p)
+    files_dir = os.path.join(pkg_dir, 'files')
+    if os.path.isdir(files_dir):
+        re_patch = re.compile(r'^[0-9]{3}_%s\.' % re.escape(p))
+        for patch in os.listdir(files_dir):
+            if re_patch.match(patch) is not None:
+                os.unlink(os.path.join(files_dir, patch))
+        if len(os.listdir(files_dir)) == 0:
+            os.rmdir(files_dir)
+
+def clean_overlay(tree, installed, create_manifest=None, quiet=False):
+    """removes the ebuilds (and their patches and metadata cache entries)
+    of the versions that are neither available on the package database
+    nor installed, and then recreates the Manifest files of the affected
+    packages. 'installed' is a list of tuples (PN, PV). Returns a list with
+    the removed packages (P).
+    """
+    category_dir = os.path.join(config.overlay, 'g-octave')
+    if not os.path.isdir(category_dir):
+        return []
+    
+    installed = set(['%s-%s' % i for i in installed])
+    with overlay_lock():
+        return _clean_overlay(tree, installed, create_manifest, quiet)
+
+def _clean_overlay(tree, installed, create_manifest, quiet):
+    category_dir = os.path.join(config.overlay, 'g-octave')
+    removed = []
+    to_manifest = []
+    
+    for pn in sorted(os.listdir(category_dir)):
+        with package_lock(pn):
+            stale = _clean_package(tree, installed, pn, quiet, to_manifest)
+        removed += stale
+    
+    # one Manifest per affected package, after all the files were removed
+    if create_manifest is not None:
+        for ebuild_file in to_manifest:
+            with package_lock(os.path.basename(os.path.dirname(ebuild_file))):
+                if create_manifest(ebuild_file) != os.EX_OK:
+                    raise GOctaveError('Failed to create Manifest file: %s' % ebuild_file)
+    
+    return removed
+
+def _clean_package(tree, installed, pn, quiet, to_manifest):
+    # returns the removed packages (P)
+    pkg_dir = os.path.join(config.overlay, 'g-octave', pn)
+    if not os.path.isdir(pkg_dir):
+        return []
+    remaining = []
+    stale = []
+    for _file in sorted(os.listdir(pkg_dir)):
+        match = re_ebuild_file.match(_file)
+        if match is None:
+            continue
+        p = match.group(1)
+        if tree.get(p) is None and p not in installed:
+            stale.append(p)
+        else:
+            remaining.append(p)
+    if len(stale) == 0:
+        return []
+    if not quiet:
+        for p in stale:
+            out.einfo('Removing ebuild: g-octave/%s.ebuild' % p)
+    if len(remaining) == 0:
+        for p in stale:
+            remove_md5_cache(p)
+        shutil.rmtree(pkg_dir)
+    else:
+        fingerprints = load_fingerprints(pn)
+        for p in stale:
+            _remove_ebuild(pkg_dir, p)
+            fingerprints.pop(p, None)
+        save_fingerprints(pn, fingerprints)
+        to_manifest.append(os.path.join(pkg_dir, remaining[0] + '.ebuild'))
+    return stale
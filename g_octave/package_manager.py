@@ -16,23 +16,63 @@ __all__ = [
     'Pkgcore',
     'Paludis',
     'get_by_name',
+    'vdb_packages',
 ]
 
 import grp
 import os
-import pwd
+import re
 import subprocess
 
 from g_octave.config import Config
+from g_octave.description_tree import DescriptionTree
 from g_octave.ebuild import Ebuild
-from g_octave.compat import open
+from g_octave.planner import UpdatePlanner
 
 conf = Config()
 
+# entries of the VDB, like 'control-1.0.11', 'control-1.0.11-r1' or
+# 'control-1.0.11_rc1', with the version syntax of the PMS
+re_vdb_entry = re.compile(
+    r'^(.+)-([0-9]+(\.[0-9]+)*[a-z]?((_alpha|_beta|_pre|_rc|_p)[0-9]*)*)(-r[0-9]+)?$'
+)
+
+# results of the user permission checks, per group: group -> bool
+_allowed_cache = {}
+
+# installed packages, per VDB directory: category dir -> (mtime, packages)
+_vdb_cache = {}
+
+def vdb_packages(vdb_dir='/var/db/pkg'):
+    """returns a list of tuples (PN, PV) with the installed g-octave packages,
+    reading the VDB directly. The result is cached until the mtime of the
+    category directory changes.
+    """
+    category_dir = os.path.join(vdb_dir, 'g-octave')
+    try:
+        mtime = os.stat(category_dir).st_mtime
+    except OSError:
+        return []
+    cached = _vdb_cache.get(category_dir)
+    if cached is not None and cached[0] == mtime:
+        return cached[1][:]
+    packages = []
+    for entry in sorted(os.listdir(category_dir)):
+        # temporary entries, like '-MERGING-control-1.0.11'
+        if entry.startswith('-'):
+            continue
+        match = re_vdb_entry.match(entry)
+        if match is not None:
+            packages.append((match.group(1), match.group(2)))
+    _vdb_cache[category_dir] = (mtime, packages)
+    return packages[:]
+
+
 class Base:
     
     _client = ''
     _group = None
+    _vdb_dir = '/var/db/pkg'
     
     post_install = []
     post_uninstall = []
@@ -45,21 +85,49 @@ class Base:
             return os.path.exists(self._client)
         return False
     
-    def do_ebuilds(self, packages):
-        for package in packages:
-            Ebuild(package[len('g-octave/'):], pkg_manager=self).create()
+    def do_ebuilds(self, packages=None):
+        """creates the ebuilds for the packages that need to be updated and
+        returns a list with their 'catpkg's. If no list of 'catpkg's is
+        provided, all the installed packages are checked.
+        """
+        tree = DescriptionTree(lazy=True)
+        planner = UpdatePlanner(tree, self.installed_versions())
+        if packages is not None:
+            packages = [i[len('g-octave/'):] for i in packages]
+        catpkgs = []
+        for p, force in planner.plan(packages):
+            ebuild = Ebuild(p, force=force, pkg_manager=self, tree=tree)
+            ebuild.create()
+            catpkgs.append('g-octave/' + ebuild.description.PN)
+        return catpkgs
+    
+    def installed_packages(self):
+        """returns a list of tuples (PN, PV) with the installed g-octave
+        packages"""
+        return vdb_packages(self._vdb_dir)
+    
+    def installed_versions(self):
+        """returns a dict with the installed g-octave packages (PN -> PV)"""
+        return dict(self.installed_packages())
+    
+    def is_allowed_user(self):
+        """checks if the current user can run the package manager, comparing
+        its primary and supplementary groups with the package manager's
+        group. The result is memoized per process.
+        """
+        if self._group not in _allowed_cache:
+            _allowed_cache[self._group] = self._check_user()
+        return _allowed_cache[self._group]
     
-    def allowed_users(self):
-        if self._group is None:
-            return [i.pw_name for i in pwd.getpwall()]
+    def _check_user(self):
+        # root is the master!!! :P
+        if self._group is None or os.getuid() == 0:
+            return True
         try:
-            users = grp.getgrnam(self._group).gr_mem
+            gid = grp.getgrnam(self._group).gr_gid
         except KeyError:
-            users = []
-        # root is the master!!! :P
-        if 'root' not in users:
-            users.append('root')
-        return users
+            return False
+        return gid == os.getgid() or gid in os.getgroups()
 
 
 class Portage(Base):
@@ -74,6 +142,7 @@ class Portage(Base):
     
     def __init__(self, ask=False, verbose=False, pretend=False, oneshot=False, nocolor=False):
         self._fullcommand = [self._client]
+        self._oneshot = oneshot
         ask and self._fullcommand.append('--ask')
         verbose and self._fullcommand.append('--verbose')
         pretend and self._fullcommand.append('--pretend')
@@ -83,27 +152,22 @@ class Portage(Base):
     def run_command(self, command):
         return subprocess.call(self._fullcommand + command)
     
-    def install_package(self, pkgatom, catpkg):
-        return self.run_command([pkgatom])
+    def install_package(self, pkgatoms, catpkgs):
+        return self.run_command(pkgatoms)
 
-    def uninstall_package(self, pkgatom, catpkg):
-        return self.run_command(['--unmerge', catpkg])
-    
-    def update_package(self, pkgatom=None, catpkg=None):
-        if catpkg is None:
-            catpkg = self.installed_packages()
-        else:
-            catpkg = [catpkg]
-        self.do_ebuilds(catpkg)
-        return self.run_command(['--update'] + catpkg)
+    def uninstall_package(self, pkgatoms, catpkgs):
+        return self.run_command(['--unmerge'] + catpkgs)
     
-    def installed_packages(self):
-        packages = []
-        with open('/var/lib/portage/world') as fp:
-            for line in fp:
-                if line.startswith('g-octave/'):
-                    packages.append(line.strip())
-        return packages
+    def update_package(self, pkgatoms=None, catpkgs=None):
+        catpkgs = self.do_ebuilds(catpkgs)
+        if len(catpkgs) == 0:
+            return os.EX_OK
+        # the installed packages are read from the VDB, that includes the
+        # dependencies, so the updates can't touch the world file
+        cmd = ['--update']
+        if not self._oneshot:
+            cmd.append('--oneshot')
+        return self.run_command(cmd + catpkgs)
     
     def create_manifest(self, ebuild):
         return subprocess.call(['ebuild', ebuild, 'manifest'])
@@ -130,6 +194,7 @@ class Pkgcore(Base):
     
     def __init__(self, ask=False, verbose=False, pretend=False, oneshot=False, nocolor=False):
         self._fullcommand = [self._client]
+        self._oneshot = oneshot
         ask and self._fullcommand.append('--ask')
         verbose and self._fullcommand.append('--verbose')
         pretend and self._fullcommand.append('--pretend')
@@ -139,33 +204,20 @@ class Pkgcore(Base):
     def run_command(self, command):
         return subprocess.call(self._fullcommand + command)
     
-    def install_package(self, pkgatom, catpkg):
-        return self.run_command([pkgatom])
+    def install_package(self, pkgatoms, catpkgs):
+        return self.run_command(pkgatoms)
 
-    def uninstall_package(self, pkgatom, catpkg):
-        return self.run_command(['--unmerge', catpkg])
-    
-    def update_package(self, pkgatom=None, catpkg=None):
-        if catpkg is None:
-            catpkg = self.installed_packages()
-        else:
-            catpkg = [catpkg]
-        self.do_ebuilds(catpkg)
-        return self.run_command(['--upgrade', '--noreplace'] + catpkg)
+    def uninstall_package(self, pkgatoms, catpkgs):
+        return self.run_command(['--unmerge'] + catpkgs)
     
-    def installed_packages(self):
-        packages = []
-        p = subprocess.Popen([
-            'pquery',
-            '--vdb',
-            '--pkgset=world',
-            '--no-version',
-            'g-octave/*',
-        ], stdout=subprocess.PIPE)
-        if p.wait() == os.EX_OK:
-            for line in p.stdout:
-                packages.append(line.strip())
-        return packages
+    def update_package(self, pkgatoms=None, catpkgs=None):
+        catpkgs = self.do_ebuilds(catpkgs)
+        if len(catpkgs) == 0:
+            return os.EX_OK
+        cmd = ['--upgrade', '--noreplace']
+        if not self._oneshot:
+            cmd.append('--oneshot')
+        return self.run_command(cmd + catpkgs)
     
     def create_manifest(self, ebuild):
         # using portage :(
@@ -199,43 +251,30 @@ class Paludis(Base):
     def run_command(self, command):
         return subprocess.call(self._fullcommand + command)
     
-    def install_package(self, pkgatom, catpkg):
+    def install_package(self, pkgatoms, catpkgs):
         cmd = [
             '--install',
             '--dl-upgrade', 'as-needed'
         ]
         if not self._oneshot:
-            cmd += ['--add-to-world-spec', catpkg]
-        cmd.append(pkgatom)
-        return self.run_command(cmd)
-
-    def uninstall_package(self, pkgatom, catpkg):
-        return self.run_command(['--uninstall', catpkg])
-    
-    def update_package(self, pkgatom=None, catpkg=None):
-        if catpkg is None:
-            catpkg = self.installed_packages()
-        else:
-            catpkg = [catpkg]
-        self.do_ebuilds(catpkg)
-        return self.run_command([
+            cmd += ['--add-to-world-spec', '( %s )' % ' '.join(catpkgs)]
+        return self.run_command(cmd + pkgatoms)
+
+    def uninstall_package(self, pkgatoms, catpkgs):
+        return self.run_command(['--uninstall'] + catpkgs)
+    
+    def update_package(self, pkgatoms=None, catpkgs=None):
+        catpkgs = self.do_ebuilds(catpkgs)
+        if len(catpkgs) == 0:
+            return os.EX_OK
+        cmd = [
             '--install',
             '--dl-upgrade', 'as-needed',
             '--dl-reinstall-targets', 'never',
-        ] + catpkg)
-    
-    def installed_packages(self):
-        packages = []
-        p = subprocess.Popen([
-            'cave',
-            'print-ids',
-            '--matching', 'g-octave/*::installed',
-            '--format', '%c/%p\n',
-        ], stdout=subprocess.PIPE)
-        if p.wait() == os.EX_OK:
-            for line in p.stdout:
-                packages.append(line.strip())
-        return packages
+        ]
+        if not self._oneshot:
+            cmd.append('--preserve-world')
+        return self.run_command(cmd + catpkgs)
 
 
 def get_by_name(name):
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+
+"""
+    g_octave.planner
+    ~~~~~~~~~~~~~~~~
+
+    This module implements a Python class that decides which of the
+    installed packages really need to be updated, avoiding the creation
+    of ebuilds for packages that are already up-to-date.
+
+    :copyright: (c) 2010 by Rafael Goncalves Martins
+    :license: GPL-2, see LICENSE for more details.
+"""
+
+from __future__ import absolute_import
+
+__all__ = ['UpdatePlanner']
+
+from .ebuild import fingerprint, load_fingerprints
+from .log import Log
+
+from portage.versions import vercmp
+
+log = Log('g_octave.planner')
+
+
+class UpdatePlanner(object):
+
+    def __init__(self, tree, installed):
+        # tree: a DescriptionTree object
+        # installed: a dict with the installed packages (PN -> PV)
+        self._tree = tree
+        self._installed = installed
+
+    def outdated(self, pn):
+        '''returns a tuple (P, force) if the package needs to be updated, where
+        'force' says if the existing ebuild must be recreated, or None if
+        the package is up-to-date.'''
+        latest = self._tree.latest_version(pn)
+        if latest is None:
+            log.info('Package not found on the package database: %s' % pn)
+            return None
+        p = '%s-%s' % (pn, latest)
+        recorded = load_fingerprints(pn).get(p)
+        if recorded is not None:
+            if fingerprint(self._tree.get(p), self._tree.db_dir) != recorded:
+                return p, True
+        installed = self._installed.get(pn)
+        if installed is None or vercmp(latest, installed) > 0:
+            return p, False
+        return None
+
+    def plan(self, packages=None):
+        '''returns a list of tuples (P, force) with the packages that need to
+        be updated. If no list of package names is provided, all the
+        installed packages are checked.'''
+        if packages is None:
+            packages = sorted(self._installed)
+        to_update = []
+        for pn in packages:
+            outdated = self.outdated(pn)
+            if outdated is not None:
+                to_update.append(outdated)
+        log.info('Packages to update: %s' % ', '.join([i[0] for i in to_update]))
+        return to_update
@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+
+"""
+    g_octave.search_index
+    ~~~~~~~~~~~~~~~~~~~~~
+
+    This module implements a Python object with an inverted index of the
+    metadata of the packages (name, title, description, maintainer,
+    categories and dependencies), used to answer the searches with results
+    ordered by relevance, and a trigram index of the package names, used to
+    prefilter the searches with regular expressions.
+
+    :copyright: (c) 2010 by Rafael Goncalves Martins
+    :license: GPL-2, see LICENSE for more details.
+"""
+
+from __future__ import absolute_import
+
+__all__ = [
+    'SearchIndex',
+    're_plain_term',
+]
+
+import bisect
+import re
+
+# searches that aren't regular expressions
+re_plain_term = re.compile(r'^[\w\s-]+$')
+
+# tokens of the indexed texts
+re_token = re.compile(r'[a-z0-9]+')
+
+
+def trigrams(text):
+    return set([text[i:i+3] for i in range(len(text) - 2)])
+
+def required_literals(pattern):
+    '''returns a list with the literal strings that any string matched by
+    the regular expression must contain, or None if we can't find out.'''
+
+    # alternatives and groups can make anything optional
+    if '|' in pattern or '(' in pattern:
+        return None
+
+    literals = []
+    current = ''
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if c == '\\':
+            # escaped chars and character classes break the literals
+            literals.append(current)
+            current = ''
+            i += 2
+            continue
+        if c == '[':
+            literals.append(current)
+            current = ''
+            end = pattern.find(']', i + 2)
+            if end == -1:
+                return None
+            i = end + 1
+            continue
+        if c in '?*{':
+            # the previous char is optional
+            literals.append(current[:-1])
+            current = ''
+            if c == '{':
+                end = pattern.find('}', i)
+                if end == -1:
+                    return None
+                i = end
+        elif c in '.^$+':
+            literals.append(current)
+            current = ''
+        else:
+            current += c
+        i += 1
+    literals.append(current)
+    return [i for i in literals if i != '']
+
+
+class SearchIndex(object):
+
+    # the indexed fields and their weights on the relevance of the results
+    fields = [
+        ('PN', 10),
+        ('title', 5),
+        ('categories', 3),
+        ('self_depends', 2),
+        ('maintainer', 1),
+        ('description', 1),
+    ]
+
+    def __init__(self):
+        # token -> {PN: score}
+        self._tokens = {}
+        # sorted list of tokens, for prefix lookups
+        self._sorted_tokens = None
+        # trigram of the (lower case) package name -> set of PN
+        self._trigrams = {}
+        self._names = set()
+        # PN -> set of tokens, used to remove packages
+        self._pn_tokens = {}
+
+    def _field_text(self, pkg, field):
+        if field == 'PN':
+            return pkg.PN
+        if field == 'self_depends':
+            return ' '.join([i[0] for i in pkg.self_depends or []])
+        return getattr(pkg, field) or ''
+
+    def add(self, pkg):
+        '''indexes a Description object (usually the latest version of the
+        package).'''
+        pn = pkg.PN
+        self._names.add(pn)
+        tokens = self._pn_tokens.setdefault(pn, set())
+        for field, weight in self.fields:
+            for token in re_token.findall(self._field_text(pkg, field).lower()):
+                scores = self._tokens.setdefault(token, {})
+                scores[pn] = scores.get(pn, 0) + weight
+                tokens.add(token)
+        for trigram in trigrams(pn.lower()):
+            self._trigrams.setdefault(trigram, set()).add(pn)
+        self._sorted_tokens = None
+
+    def remove(self, pn):
+        '''removes a package from the index.'''
+        for token in self._pn_tokens.pop(pn, []):
+            scores = self._tokens[token]
+            del scores[pn]
+            if len(scores) == 0:
+                del self._tokens[token]
+        for trigram in trigrams(pn.lower()):
+            names = self._trigrams.get(trigram, set())
+            names.discard(pn)
+            if len(names) == 0:
+                self._trigrams.pop(trigram, None)
+        self._names.discard(pn)
+        self._sorted_tokens = None
+
+    def _prefixed(self, prefix):
+        if self._sorted_tokens is None:
+            self._sorted_tokens = sorted(self._tokens)
+        i = bisect.bisect_left(self._sorted_tokens, prefix)
+        while i < len(self._sorted_tokens) and \
+          self._sorted_tokens[i].startswith(prefix):
+            yield self._sorted_tokens[i]
+            i += 1
+
+    def candidates(self, pattern):
+        '''returns a set with the package names that may match the regular
+        expression, or None if it can't be prefiltered.'''
+        literals = required_literals(pattern)
+        if literals is None:
+            return None
+        result = None
+        for literal in literals:
+            result = self._intersect(result, literal)
+        return result
+
+    def _intersect(self, names, literal):
+        for trigram in trigrams(literal.lower()):
+            if names is None:
+                names = set(self._trigrams.get(trigram, set()))
+            else:
+                names &= self._trigrams.get(trigram, set())
+        return names
+
+    def substring(self, term):
+        '''returns a set with the package names that contains the term.'''
+        term = term.lower()
+        candidates = self._intersect(None, term)
+        if candidates is None:
+            candidates = self._names
+        return set([i for i in candidates if term in i.lower()])
+
+    def search(self, term):
+        '''returns a list of tuples (PN, score) with the packages that match
+        all the words of the term, ordered by relevance.'''
+        scores = None
+        for word in re_token.findall(term.lower()):
+            # words that aren't indexed are used as prefixes
+            if word in self._tokens:
+                tokens = [word]
+            else:
+                tokens = self._prefixed(word)
+            word_scores = {}
+            for token in tokens:
+                for pn, score in self._tokens[token].items():
+                    word_scores[pn] = word_scores.get(pn, 0) + score
+            if scores is None:
+                scores = word_scores
+            else:
+                scores = dict([(i, scores[i] + word_scores[i]) \
+                    for i in scores if i in word_scores])
+        if scores is None:
+            scores = {}
+
+        # the package names containing the term (the old behaviour of the
+        # search) are always returned, at the top.
+        for pn in self.substring(term.strip()):
+            scores[pn] = scores.get(pn, 0) + 100
+            if pn.lower() == term.strip().lower():
+                scores[pn] += 100
+
+        return sorted(scores.items(), key=lambda x: (-x[1], x[0]))
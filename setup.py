@@ -139,6 +139,7 @@ setup(
             'contrib/manage_pkgdb.py',
             'contrib/manage_info.py',
             'contrib/tinderbox.py',
+            'contrib/fake_trac.py',
         ]),
     ],
     requires = ['portage'],
@@ -42,6 +42,7 @@ class TestConfig(unittest.TestCase):
         self.assertEqual(self._empty_cfg.log_level, '')
         self.assertEqual(self._empty_cfg.log_file, '/var/log/g-octave.log')
         self.assertEqual(self._empty_cfg.package_manager, 'portage')
+        self.assertEqual(self._empty_cfg.daemon_socket, '/var/run/g-octave.socket')
     
     def test_config_attributes(self):
         self.assertEqual(self._cfg.db, '/path/to/the/db')
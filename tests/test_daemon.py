@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+"""
+    test_daemon.py
+    ~~~~~~~~~~~~~~
+    
+    test suite for the *g_octave.daemon* module
+    
+    :copyright: (c) 2010 by Rafael Goncalves Martins
+    :license: GPL-2, see LICENSE for more details.
+"""
+
+import json
+import os
+import socket
+import threading
+import time
+import unittest
+import testcase
+
+from g_octave import daemon
+
+
+class TestDaemon(testcase.TestCase):
+    
+    def setUp(self):
+        testcase.TestCase.setUp(self)
+        self._socket = os.path.join(self._tempdir, 'g-octave.socket')
+        self._daemon = daemon.Daemon(self._socket, timeout=0.5)
+        self._thread = threading.Thread(target=self._daemon.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        for i in range(50):
+            if daemon._ping(self._socket):
+                break
+            time.sleep(0.1)
+    
+    def tearDown(self):
+        self._daemon.shutdown()
+        self._thread.join(5)
+        self.assertFalse(self._thread.is_alive())
+        self.assertFalse(os.path.exists(self._socket))
+        testcase.TestCase.tearDown(self)
+    
+    def test_query(self):
+        response = daemon.query(['--list-raw'], self._socket)
+        self.assertEqual(response['returncode'], os.EX_OK)
+        self.assertEqual(
+            sorted(response['output'].split()),
+            ['extra1', 'extra2', 'language1', 'language2', 'main1', 'main2']
+        )
+        response = daemon.query(['--no-colors', '--info', 'main2-0.0.1'], self._socket)
+        self.assertEqual(response['returncode'], os.EX_OK)
+        self.assertTrue('Main 2 Maintainer' in response['output'])
+        response = daemon.query(['--info', 'nonexistent'], self._socket)
+        self.assertEqual(response['returncode'], os.EX_USAGE)
+        response = daemon.query(['--no-colors', '--rdeps', 'main1-0.0.2'], self._socket)
+        self.assertEqual(response['returncode'], os.EX_OK)
+        self.assertTrue('Packages depending on main1-0.0.2' in response['output'])
+        response = daemon.query(['--rdeps', 'nonexistent'], self._socket)
+        self.assertEqual(response['returncode'], os.EX_USAGE)
+        response = daemon.query(['--filter', 'category:main', 'version:0.0.2',
+            '--format=json'], self._socket)
+        self.assertEqual(json.loads(response['output'])['name'], 'main2')
+    
+    def test_query_json(self):
+        response = daemon.query(['--search', 'main', '--format=json'], self._socket)
+        records = [json.loads(i) for i in response['output'].splitlines()]
+        self.assertEqual([i['name'] for i in records], ['main1', 'main2'])
+        self.assertEqual(records[1]['versions'], ['0.0.1', '0.0.2'])
+        self.assertEqual(records[1]['category'], 'main')
+        self.assertEqual(records[1]['depends'], ['>=sci-mathematics/octave-3.2.0'])
+        self.assertEqual(records[1]['license_gentoo'], 'GPL-3')
+        response = daemon.query(['--info', 'main2-0.0.1', '--format=json'], self._socket)
+        record = json.loads(response['output'])
+        self.assertEqual(record['version'], '0.0.1')
+        self.assertEqual(record['maintainer'], 'Main 2 Maintainer')
+    
+    def test_invalid_query(self):
+        # the errors reported by the argument parser don't stop the daemon
+        for args in [['--info'], ['--filter', 'nonexistent:foo']]:
+            response = daemon.query(args, self._socket)
+            self.assertEqual(response['returncode'], 2)
+            self.assertTrue(self._thread.is_alive())
+        self.assertTrue(daemon._ping(self._socket))
+    
+    def test_timeout(self):
+        # a client that never sends its request
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(self._socket)
+        try:
+            sock.sendall(b'{"ping"')
+            self.assertTrue(daemon._ping(self._socket))
+        finally:
+            sock.close()
+    
+    def test_fallback(self):
+        # not a query
+        self.assertEqual(daemon.query(['main1'], self._socket), None)
+        # the configuration isn't served to other users
+        self.assertEqual(daemon.query(['--config', 'trac_passwd'], self._socket), None)
+        # different configuration
+        self.assertEqual(
+            self._daemon.handle(dict(args=['--list-raw'], environ={})),
+            dict(fallback=True)
+        )
+        # daemon not running
+        self.assertEqual(daemon.query(['--list-raw'], self._socket + '.foo'), None)
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(TestDaemon('test_query'))
+    suite.addTest(TestDaemon('test_query_json'))
+    suite.addTest(TestDaemon('test_invalid_query'))
+    suite.addTest(TestDaemon('test_timeout'))
+    suite.addTest(TestDaemon('test_fallback'))
+    return suite
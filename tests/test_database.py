@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+
+"""
+    test_database.py
+    ~~~~~~~~~~~~~~~~
+
+    test suite for the *g_octave.database* module
+
+    :copyright: (c) 2010 by Rafael Goncalves Martins
+    :license: GPL-2, see LICENSE for more details.
+"""
+
+import os
+import shutil
+import unittest
+import testcase
+
+from g_octave import database
+
+
+class TestDatabase(testcase.TestCase):
+
+    def setUp(self):
+        testcase.TestCase.setUp(self)
+        self._files = os.environ['GOCTAVE_DB']
+        self._db = os.path.realpath(os.path.join(self._tempdir, 'db'))
+        os.makedirs(self._db)
+        os.environ['GOCTAVE_DB'] = self._db
+
+    def _new_generation(self):
+        gen, lock = database.new_generation()
+        shutil.copy(os.path.join(self._files, 'info.json'), gen)
+        lock.release()
+        return gen
+
+    def test_publish(self):
+        # old flat layout
+        self.assertEqual(database.path(), self._db)
+        gen1 = self._new_generation()
+        # not published yet
+        self.assertEqual(database.path(), self._db)
+        database.publish(gen1)
+        self.assertEqual(database.path(), gen1)
+        self.assertTrue(os.path.exists(os.path.join(database.path(), 'info.json')))
+        gen2 = self._new_generation()
+        database.publish(gen2)
+        self.assertEqual(database.path(), gen2)
+        self.assertEqual(database.generations(), sorted([gen1, gen2]))
+
+    def test_reclaim(self):
+        gen1 = self._new_generation()
+        database.publish(gen1)
+        reader = database.hold(gen1)
+        self.assertTrue(reader is not None)
+        gen2 = self._new_generation()
+        database.publish(gen2)
+        # gen1 is still used by the reader
+        self.assertEqual(database.reclaim(), [])
+        self.assertTrue(os.path.exists(os.path.join(gen1, 'info.json')))
+        reader.release()
+        self.assertEqual(database.reclaim(), [gen1])
+        self.assertEqual(database.generations(), [gen2])
+        # the current generation is never removed
+        self.assertEqual(database.reclaim(), [])
+        # the reclaimed generations can't be held anymore
+        self.assertEqual(database.hold(gen1), None)
+
+    def test_new_generation(self):
+        # the generations are protected while filled
+        gen, lock = database.new_generation()
+        self.assertEqual(database.reclaim(), [])
+        lock.release()
+        self.assertEqual(database.reclaim(), [gen])
+
+
+    def test_hold_current(self):
+        gen1 = self._new_generation()
+        database.publish(gen1)
+        db_dir, reader = database.hold_current()
+        self.assertEqual(db_dir, gen1)
+        self.assertTrue(reader.locked)
+        reader.release()
+        # gen1 is replaced and reclaimed between path() and hold()
+        gen2 = self._new_generation()
+        path = database.path
+        def replaced():
+            database.path = path
+            database.publish(gen2)
+            database.reclaim()
+            return gen1
+        database.path = replaced
+        try:
+            db_dir, reader = database.hold_current()
+        finally:
+            database.path = path
+        self.assertEqual(db_dir, gen2)
+        self.assertTrue(reader.locked)
+        reader.release()
+    
+    def test_reclaim_flat(self):
+        # the old flat layout is removed when not used anymore
+        shutil.copy(os.path.join(self._files, 'info.json'), self._db)
+        db_dir, reader = database.hold_current()
+        self.assertEqual(db_dir, self._db)
+        self.assertTrue(reader.locked)
+        database.publish(self._new_generation())
+        database.reclaim()
+        self.assertTrue(os.path.exists(os.path.join(self._db, 'info.json')))
+        reader.release()
+        database.reclaim()
+        self.assertFalse(os.path.exists(os.path.join(self._db, 'info.json')))
+        self.assertTrue(os.path.exists(os.path.join(database.path(), 'info.json')))
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(TestDatabase('test_publish'))
+    suite.addTest(TestDatabase('test_reclaim'))
+    suite.addTest(TestDatabase('test_new_generation'))
+    suite.addTest(TestDatabase('test_hold_current'))
+    suite.addTest(TestDatabase('test_reclaim_flat'))
+    return suite
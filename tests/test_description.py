@@ -208,6 +208,71 @@ class TestDescription(testcase.TestCase):
         self.assertEqual(self.desc.license, 'GPL version 3 or later')
         self.assertEqual(self.desc.sha1sum(), '6d1559b50a09189e5d25b402a004d12cafc8ee4f')
 
+    
+    def test_compact(self):
+        self.assertFalse(hasattr(self.desc, '__dict__'))
+        self.assertRaises(AttributeError, setattr, self.desc, 'foo', 'bar')
+        # the dependencies are stored as tuples, but returned as lists
+        self.assertTrue(isinstance(self.desc.depends, list))
+        self.assertTrue(isinstance(self.desc.self_depends, list))
+        self.assertEqual(self.desc.nonexistent, None)
+        self.assertEqual(self.desc.buildrequires, ['>g-octave/pkg14-1.0.0'])
+    
+    def test_parse_description(self):
+        source = b'''# comment: with a colon
+Name: pkg
+Description: first line
+ second line   
+not a continuation
+Depends: octave (>= 3.2.0)
+depends: pkg1
+Author: A
+Author: B
+Url: http://example.org:8080
+'''
+        self.assertEqual(description.parse_description(source), {
+            '# comment': 'with a colon',
+            'name': 'pkg',
+            'description': 'first line second line',
+            'depends': 'octave (>= 3.2.0), pkg1',
+            'author': 'A B',
+            'url': 'http://example.org:8080',
+        })
+    
+    def test_source(self):
+        desc_file = os.path.join(
+            os.path.dirname(os.path.abspath(__file__)), 'files', 'pkg-0.0.1.DESCRIPTION',
+        )
+        with open(desc_file, 'rb') as fp:
+            source = fp.read()
+        with open(desc_file, 'rb') as fp:
+            self.assertEqual(description.parse_description(fp), description.parse_description(source))
+        desc = description.Description('nonexistent/pkg-0.0.1.DESCRIPTION', source=source)
+        self.assertEqual(desc.P, 'pkg-0.0.1')
+        self.assertEqual(desc.maintainer, self.desc.maintainer)
+        self.assertEqual(desc.description, self.desc.description)
+        self.assertEqual(sorted(desc.systemrequirements), sorted(self.desc.systemrequirements))
+    
+    def test_translate_depend(self):
+        info = description.get_info(os.path.join(self._config.db, 'info.json'))
+        description.depends_cache.clear()
+        self.assertEqual(
+            description.translate_depend(' octave (>= 3.2.0)', info),
+            ('>=sci-mathematics/octave-3.2.0', None)
+        )
+        self.assertEqual(
+            description.translate_depend('pkg1 (== 1.0)', info),
+            ('=sci-mathematics/pkg1-1.0', ('pkg1', '==', '1.0'))
+        )
+        self.assertEqual(
+            description.translate_depend('control', info),
+            ('g-octave/control', ('control', None, None))
+        )
+        self.assertEqual(description.depends_cache.misses, 3)
+        description.translate_depend('octave (>= 3.2.0) ', info)
+        self.assertEqual(description.depends_cache.hits, 1)
+        self.assertRaises(description.GOctaveError, description.translate_depend, '(', info)
+
 
 def suite():
     suite = unittest.TestSuite()
@@ -215,5 +280,9 @@ def suite():
     suite.addTest(TestDescription('test_re_pkg_atom'))
     suite.addTest(TestDescription('test_re_desc_file'))
     suite.addTest(TestDescription('test_attributes'))
+    suite.addTest(TestDescription('test_compact'))
+    suite.addTest(TestDescription('test_parse_description'))
+    suite.addTest(TestDescription('test_source'))
+    suite.addTest(TestDescription('test_translate_depend'))
     return suite
 
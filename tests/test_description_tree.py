@@ -10,12 +10,14 @@
     :license: GPL-2, see LICENSE for more details.
 """
 
+import json
 import os
 import shutil
 import unittest
 import testcase
 
-from g_octave import description, description_tree
+from g_octave import checksum, database, description, description_tree
+from g_octave.exception import GOctaveError
 
 
 class TestDescriptionTree(testcase.TestCase):
@@ -93,6 +95,264 @@ class TestDescriptionTree(testcase.TestCase):
                     description.Description
                 )
             )
+    
+    def test_walk(self):
+        packages = [(pkg.P, versions) for pkg, versions in self._tree.walk()]
+        self.assertEqual(packages, [
+            ('main1-0.0.1', ['0.0.1']),
+            ('main2-0.0.2', ['0.0.1', '0.0.2']),
+            ('extra1-0.0.1', ['0.0.1']),
+            ('extra2-0.0.2', ['0.0.1', '0.0.2']),
+            ('language1-0.0.1', ['0.0.1']),
+            ('language2-0.0.2', ['0.0.1', '0.0.2']),
+        ])
+        packages = [pkg.P for pkg, versions in self._tree.walk('2$')]
+        self.assertEqual(packages, ['main2-0.0.2', 'extra2-0.0.2', 'language2-0.0.2'])
+    
+    def test_search(self):
+        # regular expressions, on the package names
+        self.assertEqual(
+            [pn for pn, versions in self._tree.search_results('^main')],
+            ['main1', 'main2']
+        )
+        self.assertEqual(
+            self._tree.search('2$'),
+            {
+                'main2': ['0.0.1', '0.0.2'],
+                'extra2': ['0.0.1', '0.0.2'],
+                'language2': ['0.0.1', '0.0.2'],
+            }
+        )
+        # words, on the package metadata
+        self.assertEqual(
+            [pn for pn, versions in self._tree.search_results('category3')],
+            ['extra2', 'language2', 'main2']
+        )
+        self.assertEqual(
+            [pn for pn, versions in self._tree.search_results('extra1')],
+            ['extra1']
+        )
+    
+    def test_reverse_dependencies(self):
+        depends = [
+            ('main3-0.0.1', 'Octave ( >= 3.2.0 ), main2 ( >= 0.0.2 ), extra1'),
+            ('main4-0.0.1', 'main2 ( < 0.0.2 )'),
+            ('main5-0.0.1', 'main2 ( >= 0.0.2 ), main2 ( < 0.0.4 )'),
+        ]
+        for p, depend in depends:
+            pn = p.split('-')[0]
+            pkg_dir = os.path.join(self._tempdir, 'main', pn)
+            os.makedirs(pkg_dir)
+            desc_file = os.path.join(pkg_dir, p + '.DESCRIPTION')
+            with open(desc_file, 'w') as fp:
+                fp.write('Name: %s\nVersion: 0.0.1\nDepends: %s\n' % (pn, depend))
+            self._tree._add(description.Description(desc_file))
+        self.assertEqual(
+            self._tree.reverse_dependencies('main2'),
+            ['main3-0.0.1', 'main4-0.0.1', 'main5-0.0.1']
+        )
+        self.assertEqual(self._tree.reverse_dependencies('main2-0.0.1'), ['main4-0.0.1'])
+        self.assertEqual(self._tree.reverse_dependencies('main2-0.0.3'),
+            ['main3-0.0.1', 'main5-0.0.1'])
+        # main5 needs both of its constraints
+        self.assertEqual(self._tree.reverse_dependencies('main2-0.0.4'), ['main3-0.0.1'])
+        self.assertEqual(self._tree.reverse_dependencies('extra1-0.0.1'), ['main3-0.0.1'])
+        self.assertEqual(self._tree.reverse_dependencies('main1'), [])
+    
+    def test_satisfies(self):
+        self.assertTrue(description_tree.satisfies('1.0.0', None, None))
+        self.assertTrue(description_tree.satisfies('1.0.0', '>=', '1.0.0'))
+        self.assertTrue(description_tree.satisfies('1.0.0', '==', '1.0.0'))
+        self.assertTrue(description_tree.satisfies('1.0.0', '<', '1.0.1'))
+        self.assertFalse(description_tree.satisfies('1.0.0', '>', '1.0.0'))
+        self.assertFalse(description_tree.satisfies('1.0.0', '=', '1.0.1'))
+    
+    def test_split_atom(self):
+        atoms = [
+            ('>=sci-mathematics/octave-3.2.0', ('>=', 'sci-mathematics/octave', '3.2.0')),
+            ('=g-octave/main1-0.0.1', ('=', 'g-octave/main1', '0.0.1')),
+            ('g-octave/main1', (None, 'g-octave/main1', None)),
+            ('sci-mathematics/pkg3', (None, 'sci-mathematics/pkg3', None)),
+        ]
+        for atom, expected in atoms:
+            self.assertEqual(description_tree.split_atom(atom), expected)
+    
+    def test_filter(self):
+        self.assertEqual(
+            self._tree.filter(category='extra'),
+            ['extra1-0.0.1', 'extra2-0.0.1', 'extra2-0.0.2']
+        )
+        self.assertEqual(len(self._tree.filter(license='GPL*')), 9)
+        self.assertEqual(self._tree.filter(license='BSD'), [])
+        self.assertEqual(
+            self._tree.filter(category='main', depends='>=sci-mathematics/octave-3.2'),
+            ['main1-0.0.1', 'main2-0.0.1', 'main2-0.0.2']
+        )
+        self.assertEqual(
+            self._tree.filter(category='main', depends='=sci-mathematics/octave-3.1.0'),
+            ['main1-0.0.1']
+        )
+        self.assertEqual(
+            self._tree.filter(depends='<sci-mathematics/octave-3.2'),
+            ['main1-0.0.1']
+        )
+        self.assertEqual(
+            self._tree.filter(category='language', buildrequires='sci-mathematics/pkg4'),
+            ['language1-0.0.1']
+        )
+        self.assertEqual(
+            self._tree.filter(systemrequirements='sci-mathematics/pkg[12]', category='main'),
+            ['main1-0.0.1']
+        )
+        self.assertEqual(
+            self._tree.filter(category='main', version='>=0.0.2'),
+            ['main2-0.0.2']
+        )
+        self.assertEqual(
+            self._tree.filter(version=['>0.0.1', '<=0.0.2']),
+            ['extra2-0.0.2', 'language2-0.0.2', 'main2-0.0.2']
+        )
+        self.assertRaises(GOctaveError, self._tree.filter, name='main1')
+        self.assertRaises(GOctaveError, self._tree.filter, version='~1.0')
+    
+    def test_overlaps(self):
+        constraints = [
+            (('<', '3.2.0'), ('>=', '3.2'), False),
+            (('<', '3.2.0'), ('>=', '3.2.0'), False),
+            (('<=', '3.2.0'), ('>=', '3.2.0'), True),
+            (('>=', '3.0.0'), ('>=', '3.2'), True),
+            (('>=', '3.0.0'), ('<', '3.2'), True),
+            (('>', '3.2.0'), ('<', '3.2.1'), True),
+            (('>', '3.2.0'), ('=', '3.2.0'), False),
+            (('=', '3.2.0'), ('==', '3.2'), True),
+            ((None, None), ('>=', '3.2'), True),
+            (('<', '3.2.0'), (None, None), True),
+        ]
+        for constraint1, constraint2, expected in constraints:
+            self.assertEqual(description_tree.overlaps(*(constraint1 + constraint2)), expected)
+            self.assertEqual(description_tree.overlaps(*(constraint2 + constraint1)), expected)
+    
+    def test_lazy(self):
+        tree = description_tree.DescriptionTree(lazy=True)
+        self.assertEqual(list.__len__(tree), 0)
+        # a single package
+        self.assertEqual(tree.latest_version('main2'), '0.0.2')
+        self.assertEqual(sorted([i.P for i in list.__iter__(tree)]), ['main2-0.0.1', 'main2-0.0.2'])
+        self.assertTrue(isinstance(tree.get('extra1-0.0.1'), description.Description))
+        self.assertFalse(tree.load_package('nonexistent'))
+        self.assertEqual(list.__len__(tree), 3)
+        # a category
+        self.assertEqual(tree.filter(category='language'), [
+            'language1-0.0.1', 'language2-0.0.1', 'language2-0.0.2'
+        ])
+        self.assertEqual(list.__len__(tree), 6)
+        # everything
+        self.assertEqual(len(tree), 9)
+        self.assertEqual(tree.list(), self._tree.list())
+    
+    def test_categories(self):
+        os.environ['GOCTAVE_CATEGORIES'] = 'main,language'
+        try:
+            tree = description_tree.DescriptionTree()
+        finally:
+            del os.environ['GOCTAVE_CATEGORIES']
+        self.assertEqual(sorted(tree.list()), ['language', 'main'])
+        self.assertEqual(tree.get('extra1-0.0.1'), None)
+        self.assertEqual(len(tree), 6)
+    
+    def test_refresh(self):
+        db = os.path.join(self._tempdir, 'db')
+        shutil.copytree(self._config.db, db)
+        os.environ['GOCTAVE_DB'] = db
+        tree = description_tree.DescriptionTree()
+        self.assertEqual(tree.search_results('extra1'), [('extra1', ['0.0.1'])])
+        self.assertEqual(tree.refresh(), dict(added=[], removed=[], changed=[]))
+        
+        pkg_dir = os.path.join(db, 'octave-forge', 'extra', 'extra1')
+        with open(os.path.join(pkg_dir, 'extra1-0.0.1.DESCRIPTION'), 'a') as fp:
+            fp.write('Title: Renamed\n')
+        shutil.copy(
+            os.path.join(pkg_dir, 'extra1-0.0.1.DESCRIPTION'),
+            os.path.join(pkg_dir, 'extra1-0.0.2.DESCRIPTION')
+        )
+        os.unlink(os.path.join(db, 'octave-forge', 'main', 'main2', 'main2-0.0.2.DESCRIPTION'))
+        shutil.rmtree(os.path.join(db, 'octave-forge', 'language', 'language1'))
+        
+        self.assertEqual(tree.refresh(), dict(
+            added = ['extra1-0.0.2'],
+            removed = ['language1-0.0.1', 'main2-0.0.2'],
+            changed = ['extra1-0.0.1'],
+        ))
+        self.assertEqual(tree.get('extra1-0.0.1').title, 'Extra 1 Title Renamed')
+        self.assertEqual(tree.package_versions('extra1'), ['0.0.1', '0.0.2'])
+        self.assertEqual(tree.latest_version('main2'), '0.0.1')
+        self.assertEqual(tree.latest_version('language1'), None)
+        self.assertEqual(len(tree), 8)
+        # the indexes were updated in place
+        self.assertEqual(tree.search_results('extra1'), [('extra1', ['0.0.1', '0.0.2'])])
+        self.assertEqual(tree.search_results('renamed'), [('extra1', ['0.0.1', '0.0.2'])])
+        self.assertEqual(tree.search_results('language1'), [])
+        self.assertEqual(tree.filter(category='language'), ['language2-0.0.1', 'language2-0.0.2'])
+        self.assertEqual(sorted(tree.list()['language']), ['language2'])
+        
+        # list of changed files
+        os.unlink(os.path.join(pkg_dir, 'extra1-0.0.2.DESCRIPTION'))
+        self.assertEqual(
+            tree.refresh(['octave-forge/extra/extra1/extra1-0.0.2.DESCRIPTION']),
+            dict(added=[], removed=['extra1-0.0.2'], changed=[])
+        )
+
+    def test_refresh_generations(self):
+        files = self._config.db
+        db = os.path.join(self._tempdir, 'db')
+        os.makedirs(db)
+        os.environ['GOCTAVE_DB'] = db
+        
+        gen1, lock = database.new_generation()
+        for f in ['octave-forge', 'info.json', 'manifest.json']:
+            src = os.path.join(files, f)
+            if os.path.isdir(src):
+                shutil.copytree(src, os.path.join(gen1, f))
+            else:
+                shutil.copy(src, gen1)
+        lock.release()
+        database.publish(gen1)
+        tree = description_tree.DescriptionTree()
+        self.assertEqual(tree.db_dir, gen1)
+        main1 = tree.get('main1-0.0.1')
+        
+        # new generation, with a modified DESCRIPTION file
+        gen2, lock = database.new_generation()
+        for f in os.listdir(gen1):
+            if f == database.lock_file:
+                continue
+            src = os.path.join(gen1, f)
+            if os.path.isdir(src):
+                shutil.copytree(src, os.path.join(gen2, f))
+            else:
+                shutil.copy(src, gen2)
+        lock.release()
+        extra1 = os.path.join(gen2, 'octave-forge', 'extra', 'extra1', 'extra1-0.0.1.DESCRIPTION')
+        with open(extra1, 'a') as fp:
+            fp.write('Title: Renamed\n')
+        manifest_file = os.path.join(gen2, 'manifest.json')
+        with open(manifest_file) as fp:
+            manifest = json.load(fp)
+        manifest['extra1-0.0.1'] = checksum.sha1_compute(extra1)
+        with open(manifest_file, 'w') as fp:
+            json.dump(manifest, fp)
+        
+        # the tree keeps using the old generation until refreshed
+        database.publish(gen2)
+        self.assertEqual(database.reclaim(), [])
+        self.assertEqual(tree.refresh(), dict(added=[], removed=[], changed=['extra1-0.0.1']))
+        self.assertEqual(tree.db_dir, gen2)
+        self.assertEqual(tree.get('extra1-0.0.1').title, 'Extra 1 Title Renamed')
+        # the unchanged packages weren't parsed again
+        self.assertTrue(tree.get('main1-0.0.1') is main1)
+        self.assertEqual(main1._file, os.path.join(gen2, 'octave-forge', 'main', 'main1', 'main1-0.0.1.DESCRIPTION'))
+        self.assertEqual(len(tree), 9)
+        self.assertEqual(database.reclaim(), [gen1])
 
 
 def suite():
@@ -101,4 +361,15 @@ def suite():
     suite.addTest(TestDescriptionTree('test_latest_version'))
     suite.addTest(TestDescriptionTree('test_latest_version_from_list'))
     suite.addTest(TestDescriptionTree('test_description_files'))
+    suite.addTest(TestDescriptionTree('test_walk'))
+    suite.addTest(TestDescriptionTree('test_search'))
+    suite.addTest(TestDescriptionTree('test_reverse_dependencies'))
+    suite.addTest(TestDescriptionTree('test_satisfies'))
+    suite.addTest(TestDescriptionTree('test_split_atom'))
+    suite.addTest(TestDescriptionTree('test_filter'))
+    suite.addTest(TestDescriptionTree('test_overlaps'))
+    suite.addTest(TestDescriptionTree('test_lazy'))
+    suite.addTest(TestDescriptionTree('test_categories'))
+    suite.addTest(TestDescriptionTree('test_refresh'))
+    suite.addTest(TestDescriptionTree('test_refresh_generations'))
     return suite
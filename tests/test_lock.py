@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+
+"""
+    test_lock.py
+    ~~~~~~~~~~~~
+
+    test suite for the *g_octave.lock* module
+
+    :copyright: (c) 2010 by Rafael Goncalves Martins
+    :license: GPL-2, see LICENSE for more details.
+"""
+
+import os
+import shutil
+import threading
+import time
+import unittest
+import testcase
+
+from g_octave import lock
+
+
+class TestLock(testcase.TestCase):
+
+    def setUp(self):
+        testcase.TestCase.setUp(self)
+        self._lock_file = os.path.join(self._tempdir, 'locks', 'test')
+
+    def test_shared(self):
+        reader1 = lock.Lock(self._lock_file)
+        reader2 = lock.Lock(self._lock_file)
+        writer = lock.Lock(self._lock_file, exclusive=True)
+        self.assertTrue(reader1.acquire())
+        self.assertTrue(os.path.exists(self._lock_file))
+        self.assertTrue(reader2.acquire(blocking=False))
+        self.assertFalse(writer.acquire(blocking=False))
+        reader1.release()
+        self.assertFalse(writer.acquire(blocking=False))
+        reader2.release()
+        self.assertTrue(writer.acquire(blocking=False))
+        self.assertFalse(reader1.acquire(blocking=False))
+        writer.release()
+        self.assertFalse(writer.locked)
+
+    def test_wait(self):
+        writer = lock.Lock(self._lock_file, exclusive=True)
+        writer.acquire()
+        timer = threading.Timer(0.1, writer.release)
+        timer.start()
+        start = time.time()
+        with lock.Lock(self._lock_file) as reader:
+            self.assertTrue(reader.locked)
+            self.assertTrue(time.time() - start >= 0.1)
+        self.assertFalse(reader.locked)
+        timer.join()
+
+    def test_removed(self):
+        # the lock file is removed by the holder of the lock, the waiting
+        # process must use a new one.
+        writer = lock.Lock(self._lock_file, exclusive=True)
+        writer.acquire()
+        def remove():
+            shutil.rmtree(os.path.dirname(self._lock_file))
+            writer.release()
+        timer = threading.Timer(0.1, remove)
+        timer.start()
+        reader = lock.Lock(self._lock_file)
+        self.assertTrue(reader.acquire())
+        self.assertTrue(os.path.exists(self._lock_file))
+        timer.join()
+        self.assertFalse(writer.acquire(blocking=False))
+        reader.release()
+
+    def test_create(self):
+        reader = lock.Lock(self._lock_file, create=False)
+        self.assertFalse(reader.acquire())
+        self.assertFalse(os.path.exists(self._lock_file))
+
+    def test_package_lock(self):
+        with lock.package_lock('main1') as pkg_lock:
+            self.assertEqual(
+                pkg_lock.path,
+                os.path.join(self._config.overlay, '.locks', 'g-octave', 'main1')
+            )
+            self.assertFalse(lock.package_lock('main1').acquire(blocking=False))
+            other = lock.package_lock('main2')
+            self.assertTrue(other.acquire(blocking=False))
+            other.release()
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(TestLock('test_shared'))
+    suite.addTest(TestLock('test_wait'))
+    suite.addTest(TestLock('test_removed'))
+    suite.addTest(TestLock('test_create'))
+    suite.addTest(TestLock('test_package_lock'))
+    return suite
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+
+"""
+    test_lru.py
+    ~~~~~~~~~~~
+    
+    test suite for the *g_octave.lru* module
+    
+    :copyright: (c) 2010 by Rafael Goncalves Martins
+    :license: GPL-2, see LICENSE for more details.
+"""
+
+import unittest
+
+from g_octave.lru import LRUCache
+
+
+class TestLRUCache(unittest.TestCase):
+    
+    def test_eviction(self):
+        cache = LRUCache(2)
+        cache['a'] = 1
+        cache['b'] = 2
+        self.assertEqual(cache.get('a'), 1)
+        # 'b' is the least recently used
+        cache['c'] = 3
+        self.assertEqual(len(cache), 2)
+        self.assertTrue('a' in cache)
+        self.assertFalse('b' in cache)
+        self.assertEqual(cache.get('b', 'default'), 'default')
+        # updating a value makes it the most recently used
+        cache['a'] = 4
+        cache['d'] = 5
+        self.assertEqual(cache.get('a'), 4)
+        self.assertEqual(cache.get('c'), None)
+    
+    def test_stats(self):
+        cache = LRUCache()
+        cache['a'] = 1
+        cache.get('a')
+        cache.get('a')
+        cache.get('b')
+        self.assertEqual(cache.stats(), dict(hits=2, misses=1, size=1))
+        cache.clear()
+        self.assertEqual(cache.stats(), dict(hits=0, misses=0, size=0))
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(TestLRUCache('test_eviction'))
+    suite.addTest(TestLRUCache('test_stats'))
+    return suite
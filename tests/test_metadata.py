@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+
+"""
+    test_metadata.py
+    ~~~~~~~~~~~~~~~~
+    
+    test suite for the *g_octave.metadata* module
+    
+    :copyright: (c) 2010 by Rafael Goncalves Martins
+    :license: GPL-2, see LICENSE for more details.
+"""
+
+import os
+import unittest
+import testcase
+
+from g_octave import description, metadata
+
+
+class TestMetadata(testcase.TestCase):
+    
+    def setUp(self):
+        testcase.TestCase.setUp(self)
+        self._portdir = os.path.join(self._tempdir, 'portdir')
+        eclasses = {
+            'base': '',
+            'autotools': 'inherit eutils libtool\n',
+            'eutils': '',
+            'libtool': '# inherit nothing\n',
+        }
+        os.makedirs(os.path.join(self._portdir, 'eclass'))
+        os.makedirs(os.path.join(self._config.overlay, 'eclass'))
+        for eclass in eclasses:
+            with open(os.path.join(self._portdir, 'eclass', eclass + '.eclass'), 'w') as fp:
+                fp.write(eclasses[eclass])
+        with open(os.path.join(self._config.overlay, 'eclass', 'g-octave.eclass'), 'w') as fp:
+            fp.write('inherit base autotools\n')
+        self._ebuild = os.path.join(self._tempdir, 'main2-0.0.2.ebuild')
+        with open(self._ebuild, 'w') as fp:
+            fp.write('# fake ebuild\n')
+        self._desc = description.Description(os.path.join(
+            os.path.dirname(os.path.abspath(__file__)), 'files', 'octave-forge',
+            'main', 'main2', 'main2-0.0.2.DESCRIPTION'
+        ))
+        # metadata as returned by the package manager
+        self._values = dict(
+            DEFINED_PHASES = 'compile configure install',
+            DEPEND = '>=sci-mathematics/octave-3.2.0\n\t>sci-mathematics/pkg8-1.0.0 ' \
+                '>=sys-devel/automake-1.10',
+            DESCRIPTION = 'This is the Main 2  description',
+            EAPI = '3',
+            HOMEPAGE = 'http://main2.org',
+            INHERITED = 'autotools base eutils g-octave libtool',
+            IUSE = '',
+            KEYWORDS = '~amd64  ~x86',
+            LICENSE = 'GPL-3',
+            RDEPEND = '>=sci-mathematics/octave-3.2.0\n\t>sci-mathematics/pkg8-1.0.0',
+            SLOT = '0',
+            SRC_URI = 'mirror://sourceforge/octave/main2-0.0.2.tar.gz',
+        )
+    
+    def test_eclasses(self):
+        names = ['autotools', 'base', 'eutils', 'g-octave', 'libtool']
+        eclasses = metadata.eclasses(names, portdir=self._portdir)
+        self.assertEqual(sorted(eclasses.keys()), names)
+        self.assertEqual(eclasses['base'], 'd41d8cd98f00b204e9800998ecf8427e')
+        self.assertEqual(metadata.eclasses(['subversion'], portdir=self._portdir), None)
+        # the checksums are recomputed when the eclass changes
+        base = os.path.join(self._portdir, 'eclass', 'base.eclass')
+        with open(base, 'w') as fp:
+            fp.write('# changed\n')
+        os.utime(base, (0, 0))
+        self.assertNotEqual(
+            metadata.eclasses(['base'], portdir=self._portdir)['base'],
+            eclasses['base']
+        )
+    
+    def test_md5_cache(self):
+        self.assertTrue(metadata.update_md5_cache(self._desc, self._ebuild,
+            portdir=self._portdir, values=self._values))
+        cache_file = os.path.join(self._config.overlay, 'metadata',
+            'md5-cache', 'g-octave', 'main2-0.0.2')
+        with open(cache_file) as fp:
+            entry = dict([i.rstrip('\n').split('=', 1) for i in fp])
+        self.assertEqual(entry['RDEPEND'], '>=sci-mathematics/octave-3.2.0 >sci-mathematics/pkg8-1.0.0')
+        self.assertEqual(entry['DEPEND'], entry['RDEPEND'] + ' >=sys-devel/automake-1.10')
+        self.assertEqual(entry['DESCRIPTION'], 'This is the Main 2  description')
+        self.assertEqual(entry['KEYWORDS'], '~amd64 ~x86')
+        self.assertEqual(entry['LICENSE'], 'GPL-3')
+        self.assertEqual(entry['EAPI'], '3')
+        self.assertEqual(entry['_md5_'], metadata.md5_compute(self._ebuild))
+        self.assertEqual(entry['SRC_URI'], 'mirror://sourceforge/octave/main2-0.0.2.tar.gz')
+        self.assertEqual(entry['_eclasses_'].split('\t')[::2],
+            ['autotools', 'base', 'eutils', 'g-octave', 'libtool'])
+        self.assertFalse('IUSE' in entry)
+        self.assertFalse('INHERITED' in entry)
+        # the entry is removed if some eclass wasn't found
+        self._values['INHERITED'] += ' subversion'
+        self.assertFalse(metadata.update_md5_cache(self._desc, self._ebuild,
+            portdir=self._portdir, values=self._values))
+        self.assertFalse(os.path.exists(cache_file))
+        self._values['INHERITED'] = 'base'
+        self.assertTrue(metadata.update_md5_cache(self._desc, self._ebuild,
+            portdir=self._portdir, values=self._values))
+        metadata.remove_md5_cache('main2-0.0.2')
+        self.assertFalse(os.path.exists(cache_file))
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(TestMetadata('test_eclasses'))
+    suite.addTest(TestMetadata('test_md5_cache'))
+    return suite
@@ -14,7 +14,7 @@ import os
 import unittest
 import testcase
 
-from g_octave import config, overlay
+from g_octave import config, description_tree, ebuild, overlay
 
 
 class TestOverlay(testcase.TestCase):
@@ -24,6 +24,7 @@ class TestOverlay(testcase.TestCase):
         files = {
             os.path.join(self._config.overlay, 'profiles', 'repo_name'): 'g-octave',
             os.path.join(self._config.overlay, 'profiles', 'categories'): 'g-octave',
+            os.path.join(self._config.overlay, 'metadata', 'layout.conf'): overlay.LAYOUT_CONF,
         }
         for _file in files:
             self.assertTrue(os.path.exists(_file))
@@ -33,9 +34,38 @@ class TestOverlay(testcase.TestCase):
             os.path.join(self._config.overlay, 'eclass', 'g-octave.eclass')
         ))
 
+    def test_clean_overlay(self):
+        overlay.create_overlay(quiet=True)
+        tree = description_tree.DescriptionTree()
+        for p in ['main1-0.0.1', 'main2-0.0.1']:
+            ebuild.Ebuild(p, tree=tree).create(
+                accept_keywords = 'amd64 ~amd64 x86 ~x86',
+                manifest = False,
+                display_info = False,
+                nodeps = True
+            )
+        pkg_dir = os.path.join(self._config.overlay, 'g-octave', 'main2')
+        for p in ['main2-0.0.0', 'main2-0.0.3']:
+            with open(os.path.join(pkg_dir, p + '.ebuild'), 'w') as fp:
+                fp.write('# stale ebuild\n')
+        manifests = []
+        def create_manifest(ebuild_file):
+            manifests.append(ebuild_file)
+            return os.EX_OK
+        removed = overlay.clean_overlay(tree, [('main2', '0.0.3')],
+            create_manifest, quiet=True)
+        self.assertEqual(removed, ['main2-0.0.0'])
+        self.assertEqual(manifests, [os.path.join(pkg_dir, 'main2-0.0.1.ebuild')])
+        self.assertEqual(
+            sorted([i for i in os.listdir(pkg_dir) if i.endswith('.ebuild')]),
+            ['main2-0.0.1.ebuild', 'main2-0.0.3.ebuild']
+        )
+        self.assertEqual(overlay.clean_overlay(tree, [], quiet=True), ['main2-0.0.3'])
+
 
 def suite():
     suite = unittest.TestSuite()
     suite.addTest(TestOverlay('test_overlay'))
+    suite.addTest(TestOverlay('test_clean_overlay'))
     return suite
         
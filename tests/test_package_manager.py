@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+
+"""
+    test_package_manager.py
+    ~~~~~~~~~~~~~~~~~~~~~~~
+    
+    test suite for the *g_octave.package_manager* module
+    
+    :copyright: (c) 2010 by Rafael Goncalves Martins
+    :license: GPL-2, see LICENSE for more details.
+"""
+
+import grp
+import os
+import unittest
+import testcase
+
+from g_octave import package_manager
+
+
+class TestPackageManager(testcase.TestCase):
+    
+    def setUp(self):
+        testcase.TestCase.setUp(self)
+        self._vdb = os.path.join(self._tempdir, 'vdb')
+        for entry in ['main1-0.0.1', 'extra2-0.0.2-r1', 'language2-0.0.2_rc1-r1',
+                      '-MERGING-main2-0.0.2']:
+            os.makedirs(os.path.join(self._vdb, 'g-octave', entry))
+        os.makedirs(os.path.join(self._vdb, 'sci-mathematics', 'octave-3.2.4'))
+    
+    def test_vdb_packages(self):
+        installed = [('extra2', '0.0.2'), ('language2', '0.0.2_rc1'), ('main1', '0.0.1')]
+        self.assertEqual(package_manager.vdb_packages(self._vdb), installed)
+        # cached
+        self.assertEqual(package_manager.vdb_packages(self._vdb), installed)
+        os.makedirs(os.path.join(self._vdb, 'g-octave', 'language1-0.0.1'))
+        self.assertEqual(
+            package_manager.vdb_packages(self._vdb),
+            [('extra2', '0.0.2'), ('language1', '0.0.1'),
+             ('language2', '0.0.2_rc1'), ('main1', '0.0.1')]
+        )
+        self.assertEqual(package_manager.vdb_packages(self._tempdir), [])
+    
+    def test_installed_packages(self):
+        for pm in [package_manager.Portage, package_manager.Pkgcore, package_manager.Paludis]:
+            pkg_manager = pm()
+            pkg_manager._vdb_dir = self._vdb
+            self.assertEqual(
+                pkg_manager.installed_versions(),
+                {'extra2': '0.0.2', 'language2': '0.0.2_rc1', 'main1': '0.0.1'}
+            )
+    
+    def test_update_oneshot(self):
+        # the updates never add the packages to the world file
+        expected = [
+            (package_manager.Portage, ['--update', '--oneshot']),
+            (package_manager.Pkgcore, ['--upgrade', '--noreplace', '--oneshot']),
+            (package_manager.Paludis, ['--install', '--dl-upgrade', 'as-needed',
+                '--dl-reinstall-targets', 'never', '--preserve-world']),
+        ]
+        for pm, cmd in expected:
+            pkg_manager = pm()
+            pkg_manager.do_ebuilds = lambda catpkgs: ['g-octave/main1']
+            pkg_manager.run_command = lambda command: command
+            self.assertEqual(pkg_manager.update_package(), cmd + ['g-octave/main1'])
+    
+    def test_is_allowed_user(self):
+        class MyGroup(package_manager.Base):
+            _group = grp.getgrgid(os.getgid()).gr_name
+        class NoGroup(package_manager.Base):
+            _group = 'g-octave-nonexistent-group'
+        package_manager._allowed_cache.clear()
+        self.assertTrue(MyGroup().is_allowed_user())
+        self.assertEqual(NoGroup().is_allowed_user(), os.getuid() == 0)
+        self.assertTrue(package_manager.Base().is_allowed_user())
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(TestPackageManager('test_vdb_packages'))
+    suite.addTest(TestPackageManager('test_installed_packages'))
+    suite.addTest(TestPackageManager('test_update_oneshot'))
+    suite.addTest(TestPackageManager('test_is_allowed_user'))
+    return suite
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+
+"""
+    test_planner.py
+    ~~~~~~~~~~~~~~~
+    
+    test suite for the *g_octave.planner* module
+    
+    :copyright: (c) 2010 by Rafael Goncalves Martins
+    :license: GPL-2, see LICENSE for more details.
+"""
+
+import os
+import shutil
+import unittest
+import testcase
+
+from g_octave import description_tree, ebuild, overlay, planner
+
+
+class TestPlanner(testcase.TestCase):
+    
+    def setUp(self):
+        testcase.TestCase.setUp(self)
+        overlay.create_overlay(quiet=True)
+        self._tree = description_tree.DescriptionTree()
+    
+    def test_plan(self):
+        installed = {
+            'main1': '0.0.1',
+            'main2': '0.0.1',
+            'extra2': '0.0.2',
+        }
+        _planner = planner.UpdatePlanner(self._tree, installed)
+        self.assertEqual(_planner.plan(), [('main2-0.0.2', False)])
+        self.assertEqual(
+            _planner.plan(['main2', 'language1']),
+            [('main2-0.0.2', False), ('language1-0.0.1', False)]
+        )
+    
+    def test_plan_fingerprint(self):
+        # the DESCRIPTION file is changed on a copy of the package database
+        db = os.path.join(self._tempdir, 'db')
+        shutil.copytree(self._config.db, db)
+        os.environ['GOCTAVE_DB'] = db
+        self._tree = description_tree.DescriptionTree()
+        _ebuild = ebuild.Ebuild('main1-0.0.1', tree=self._tree)
+        _ebuild.create(
+            accept_keywords = 'amd64 ~amd64 x86 ~x86',
+            manifest = False,
+            display_info = False
+        )
+        self.assertEqual(
+            ebuild.load_fingerprints('main1'),
+            {'main1-0.0.1': _ebuild.fingerprint()}
+        )
+        _planner = planner.UpdatePlanner(self._tree, {'main1': '0.0.1'})
+        self.assertEqual(_planner.plan(), [])
+        with open(self._tree.get('main1-0.0.1')._file, 'ab') as fp:
+            fp.write(b'# changed\n')
+        self.assertEqual(_planner.plan(), [('main1-0.0.1', True)])
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(TestPlanner('test_plan'))
+    suite.addTest(TestPlanner('test_plan_fingerprint'))
+    return suite
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+
+"""
+    test_search_index.py
+    ~~~~~~~~~~~~~~~~~~~~
+    
+    test suite for the *g_octave.search_index* module
+    
+    :copyright: (c) 2010 by Rafael Goncalves Martins
+    :license: GPL-2, see LICENSE for more details.
+"""
+
+import unittest
+
+from g_octave import search_index
+
+
+class Package(object):
+    
+    def __init__(self, pn, title, description, categories, self_depends=[]):
+        self.PN = pn
+        self.title = title
+        self.description = description
+        self.categories = categories
+        self.self_depends = self_depends
+        self.maintainer = None
+
+
+class TestSearchIndex(unittest.TestCase):
+    
+    def setUp(self):
+        self._index = search_index.SearchIndex()
+        self._index.add(Package('signal', 'Signal processing tools',
+            'Signal processing tools, including filtering, windowing and display functions.',
+            'Signal processing', [('optim', '>=', '1.0.0')]))
+        self._index.add(Package('optim', 'Optimization toolkit',
+            'Non-linear optimization toolkit.', 'Optimization'))
+        self._index.add(Package('image', 'Image processing',
+            'The Octave-forge Image package provides functions for processing images.',
+            'Image processing'))
+        self._index.add(Package('imageio', 'Image I/O',
+            'Reading and writing of images.', 'Image'))
+    
+    def test_required_literals(self):
+        literals = [
+            ('abc', ['abc']),
+            ('^ab.c$', ['ab', 'c']),
+            ('ab?cd', ['a', 'cd']),
+            ('a{2}bcd', ['bcd']),
+            ('x[abc]yz', ['x', 'yz']),
+            (r'ab\dcd', ['ab', 'cd']),
+            ('a|b', None),
+            ('(ab)', None),
+        ]
+        for pattern, expected in literals:
+            self.assertEqual(search_index.required_literals(pattern), expected)
+    
+    def test_candidates(self):
+        self.assertEqual(self._index.candidates('^image'), set(['image', 'imageio']))
+        self.assertEqual(self._index.candidates('ima.*io'), set(['image', 'imageio']))
+        self.assertEqual(self._index.candidates('sig|opt'), None)
+    
+    def test_search(self):
+        results = [pn for pn, score in self._index.search('processing')]
+        self.assertEqual(sorted(results), ['image', 'signal'])
+        # the exact name comes first, then the names containing the term
+        results = [pn for pn, score in self._index.search('image')]
+        self.assertEqual(results, ['image', 'imageio'])
+        # all the words must match, and unknown words are used as prefixes
+        results = [pn for pn, score in self._index.search('filter window')]
+        self.assertEqual(results, ['signal'])
+        # the dependencies are indexed too
+        results = [pn for pn, score in self._index.search('optim')]
+        self.assertEqual(results, ['optim', 'signal'])
+        self.assertEqual(self._index.search('nothing'), [])
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(TestSearchIndex('test_required_literals'))
+    suite.addTest(TestSearchIndex('test_candidates'))
+    suite.addTest(TestSearchIndex('test_search'))
+    return suite
@@ -0,0 +1,375 @@
+# -*- coding: utf-8 -*-
+
+"""
+    test_tinderbox.py
+    ~~~~~~~~~~~~~~~~~
+    
+    test suite for the tinderbox script (contrib/tinderbox.py), using the
+    fake Trac server (contrib/fake_trac.py)
+    
+    :copyright: (c) 2010 by Rafael Goncalves Martins
+    :license: GPL-2, see LICENSE for more details.
+"""
+
+import gzip
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+import unittest
+import testcase
+
+from io import BytesIO
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'contrib'))
+
+import fake_trac
+import tinderbox
+
+from g_octave import description_tree, overlay
+
+
+class TestScheduler(unittest.TestCase):
+    
+    def setUp(self):
+        self._graph = {
+            'a': set(),
+            'b': set(['a']),
+            'c': set(['b']),
+            'd': set(),
+            'e': set(['a', 'd']),
+            'f': set(['g']),
+            'g': set(['f']),
+        }
+        self._lock = threading.Lock()
+        self._running = 0
+        self._max_running = 0
+        self._built = []
+    
+    def _build(self, pn):
+        with self._lock:
+            self._running += 1
+            self._max_running = max(self._max_running, self._running)
+        time.sleep(0.05)
+        with self._lock:
+            self._running -= 1
+            self._built.append(pn)
+        return (pn == 'b') and 1 or os.EX_OK, []
+    
+    def test_run(self):
+        scheduler = tinderbox.Scheduler(self._graph, self._build, jobs=3)
+        self.assertEqual(scheduler.run(), dict(
+            a = 'ok',
+            b = 'failed',
+            c = 'skipped',
+            d = 'ok',
+            e = 'ok',
+            f = 'skipped',
+            g = 'skipped',
+        ))
+        self.assertEqual(sorted(self._built), ['a', 'b', 'd', 'e'])
+        # the dependencies were built first
+        self.assertTrue(self._built.index('e') > self._built.index('a'))
+        self.assertTrue(self._built.index('b') > self._built.index('a'))
+        self.assertEqual(self._max_running, 2)
+    
+    def test_built(self):
+        results = []
+        scheduler = tinderbox.Scheduler(self._graph, self._build, jobs=1,
+            callback=lambda *args: results.append(args[0]), built=['a', 'd'])
+        status = scheduler.run()
+        self.assertEqual(status['a'], 'cached')
+        self.assertEqual(status['e'], 'ok')
+        self.assertEqual(self._built, ['b', 'e'])
+        self.assertEqual(results, ['b', 'e'])
+        self.assertEqual(self._max_running, 1)
+
+class TestFingerprints(testcase.TestCase):
+    
+    def setUp(self):
+        testcase.TestCase.setUp(self)
+        self._db = os.path.join(self._tempdir, 'db')
+        shutil.copytree(self._config.db, self._db)
+        os.environ['GOCTAVE_DB'] = self._db
+        # the octave version is read from the installed packages
+        self._octave_version = tinderbox.octave_version
+        tinderbox.octave_version = lambda: 'sci-mathematics/octave-3.2.4'
+        self._graph = {
+            'main1': set(),
+            'main2': set(['main1']),
+            'extra1': set(),
+        }
+        self._results = tinderbox.Results(os.path.join(self._tempdir, 'results.json'))
+    
+    def tearDown(self):
+        tinderbox.octave_version = self._octave_version
+        testcase.TestCase.tearDown(self)
+    
+    def _fingerprints(self):
+        return tinderbox.Fingerprints(self._graph, description_tree.DescriptionTree())
+    
+    def test_propagation(self):
+        fingerprints = self._fingerprints()
+        before = dict([(i, fingerprints(i)) for i in self._graph])
+        patch = os.path.join(self._db, 'patches', '001_main1-0.0.1.patch')
+        with open(patch, 'a') as fp:
+            fp.write('# changed\n')
+        after = self._fingerprints()
+        # the changes of the dependencies are propagated
+        self.assertNotEqual(before['main1'], after('main1'))
+        self.assertNotEqual(before['main2'], after('main2'))
+        self.assertEqual(before['extra1'], after('extra1'))
+        # without manifest.json the DESCRIPTION files are hashed
+        os.unlink(os.path.join(self._db, 'manifest.json'))
+        self.assertEqual(self._fingerprints()('main2'), after('main2'))
+    
+    def test_cached(self):
+        overlay.create_overlay(quiet=True)
+        fingerprints = self._fingerprints()
+        packages = sorted(self._graph)
+        for pn in packages:
+            self._results.record(pn, fingerprints(pn), os.EX_OK)
+            ebuild_dir = os.path.join(self._config.overlay, 'g-octave', pn)
+            os.makedirs(ebuild_dir)
+            p = fingerprints.tree.lookup(pn).P
+            with open(os.path.join(ebuild_dir, p + '.ebuild'), 'w') as fp:
+                fp.write('# fake ebuild\n')
+        results = tinderbox.Results(self._results.filename)
+        self.assertEqual(
+            tinderbox.cached_packages(packages, fingerprints, results),
+            packages
+        )
+        # --rebuild-all
+        self.assertEqual(
+            tinderbox.cached_packages(packages, fingerprints, results, True),
+            []
+        )
+        # the failures are evicted
+        results.record('extra1', fingerprints('extra1'), 1)
+        self.assertEqual(
+            tinderbox.cached_packages(packages, fingerprints, results),
+            ['main1', 'main2']
+        )
+        with open(results.filename) as fp:
+            self.assertFalse('extra1' in json.load(fp))
+        # the ebuilds removed from the overlay are built again
+        shutil.rmtree(os.path.join(self._config.overlay, 'g-octave', 'main2'))
+        self.assertEqual(
+            tinderbox.cached_packages(packages, fingerprints, results),
+            ['main1']
+        )
+
+class TestBuilder(testcase.TestCase):
+    
+    def setUp(self):
+        testcase.TestCase.setUp(self)
+        self._db = os.path.join(self._tempdir, 'db')
+        shutil.copytree(self._config.db, self._db)
+        os.environ['GOCTAVE_DB'] = self._db
+    
+    def _builder(self):
+        builder = tinderbox.Builder(description_tree.DescriptionTree())
+        # nothing is built, only the ebuilds are created
+        builder._create_manifest = lambda ebuild_file: os.EX_OK
+        def install_package(pkgatoms, catpkgs):
+            builder.pkg_manager.last.cpu = builder.pkg_manager.last.max_rss = 0
+            return os.EX_OK
+        builder.pkg_manager.install_package = install_package
+        return builder
+    
+    def _ebuild(self):
+        ebuild_file = os.path.join(self._config.overlay, 'g-octave', 'main1',
+            'main1-0.0.1.ebuild')
+        with open(ebuild_file) as fp:
+            return fp.read()
+    
+    def test_force(self):
+        self.assertEqual(self._builder()('main1')[0], os.EX_OK)
+        self.assertTrue('LICENSE="GPL-3"' in self._ebuild())
+        description = os.path.join(self._db, 'octave-forge', 'main', 'main1',
+            'main1-0.0.1.DESCRIPTION')
+        with open(description) as fp:
+            content = fp.read()
+        with open(description, 'w') as fp:
+            fp.write(content.replace('License: GPL-3', 'License: GPL-2'))
+        # the ebuild on the overlay is kept, unless the build is forced
+        self._builder()('main1')
+        self.assertTrue('LICENSE="GPL-3"' in self._ebuild())
+        builder = self._builder()
+        self.assertEqual(builder('main1', True)[0], os.EX_OK)
+        self.assertTrue('LICENSE="GPL-2"' in self._ebuild())
+        self.assertEqual(builder.metrics['main1']['version'], 'main1-0.0.1')
+
+class TestTrac(testcase.TestCase):
+    
+    def setUp(self):
+        testcase.TestCase.setUp(self)
+        self._server = fake_trac.FakeTracServer()
+        self._server.start()
+        self._trac = tinderbox.Trac(self._server.url, retries=2, backoff=0.01)
+        self._logs = []
+        for i, size in enumerate([100, 100000]):
+            log = os.path.join(self._tempdir, 'build%i.log' % i)
+            with open(log, 'w') as fp:
+                fp.write('x' * size)
+            self._logs.append(log)
+    
+    def tearDown(self):
+        self._server.shutdown()
+        self._server.server_close()
+        testcase.TestCase.tearDown(self)
+    
+    def test_read_log(self):
+        self.assertEqual(tinderbox.read_log(self._logs[0]), ('build0.log', b'x' * 100))
+        filename, content = tinderbox.read_log(self._logs[1])
+        self.assertEqual(filename, 'build1.log.gz')
+        self.assertTrue(len(content) < 100000)
+        fp = gzip.GzipFile(fileobj=BytesIO(content))
+        self.assertEqual(fp.read(), b'x' * 100000)
+    
+    def test_report(self):
+        old_id = self._server.trac.create(
+            tinderbox.Trac.default_summary % {'pkgatom': 'main1'}, '')
+        logs = [tinderbox.read_log(i) for i in self._logs]
+        self.assertEqual(self._trac.report([('main1', logs), ('main2', logs[:1])]), [])
+        # query, create, putAttachment and update
+        self.assertEqual(self._server.requests, 4)
+        tickets = self._server.trac.tickets
+        self.assertEqual(len(tickets), 2)
+        self.assertEqual(sorted(tickets[old_id]['attachments']), ['build0.log', 'build1.log.gz'])
+        self.assertEqual(len(tickets[old_id]['comments']), 1)
+        self.assertTrue('build1.log.gz' in tickets[old_id]['comments'][0])
+        new_id = self._trac.multicall([('ticket.query', ('summary=~main2',))])[0][0]
+        self.assertEqual(tickets[new_id]['summary'], '=g-octave/main2 fails to build. #tinderbox')
+        self.assertEqual(tickets[new_id]['comments'], [])
+        self.assertEqual(list(tickets[new_id]['attachments'].values()), [b'x' * 100])
+    
+    def test_retry(self):
+        self._server.failures = 2
+        self.assertEqual(self._trac.report([('main1', [])]), [])
+        self.assertEqual(len(self._server.trac.tickets), 1)
+        self._server.failures = 3
+        self.assertRaises(tinderbox.TracError, self._trac.report, [('main2', [])])
+    
+    def test_lost_response(self):
+        # the tickets created by a request whose response was lost aren't
+        # created again
+        self._server.lost_creates = 1
+        self.assertEqual(self._trac.report([('main1', []), ('main2', [])]), [])
+        self.assertEqual(len(self._server.trac.tickets), 2)
+    
+    def test_reporter(self):
+        reporter = tinderbox.Reporter(self._trac)
+        reporter.submit('main1', self._logs)
+        # a missing log doesn't stop the report
+        reporter.submit('main2', [os.path.join(self._tempdir, 'nonexistent.log')])
+        reporter.close()
+        self.assertEqual(reporter.failed, [])
+        self.assertEqual(len(self._server.trac.tickets), 2)
+        # Trac unavailable
+        self._server.failures = 10
+        reporter = tinderbox.Reporter(self._trac)
+        reporter.submit('main3', self._logs)
+        reporter.close()
+        self.assertEqual(reporter.failed, ['main3'])
+        # unexpected errors don't stop the reporter
+        self._server.failures = 0
+        report = self._trac.report
+        def broken(reports):
+            self._trac.report = report
+            raise KeyError('malformed response')
+        self._trac.report = broken
+        reporter = tinderbox.Reporter(self._trac)
+        reporter.submit('main4', [])
+        for i in range(50):
+            if len(reporter.failed) > 0:
+                break
+            time.sleep(0.1)
+        reporter.submit('main5', [])
+        reporter.close()
+        self.assertEqual(reporter.failed, ['main4'])
+        self.assertEqual(len(self._trac.multicall([('ticket.query', ('summary=~main5',))])[0]), 1)
+
+class TestMetrics(testcase.TestCase):
+    
+    def _build(self, run_id, package, wall, return_code=os.EX_OK):
+        self._metrics.record(run_id, package, return_code, dict(
+            version = package + '-1.0',
+            wall = wall,
+            cpu = wall / 2,
+            max_rss = 1024,
+            ebuild = 0.1,
+            manifest = 0.2,
+            package_manager = wall - 0.3,
+            lock_wait = 5,
+        ))
+    
+    def test_metrics(self):
+        self._metrics = tinderbox.Metrics(os.path.join(self._tempdir, 'metrics.sqlite'))
+        self.assertEqual(self._metrics.last_run(), None)
+        run1 = self._metrics.start_run(1.5)
+        self._build(run1, 'main1', 100)
+        self._build(run1, 'main2', 50)
+        self._build(run1, 'extra1', 10, 1)
+        run2 = self._metrics.start_run(1.5)
+        self._build(run2, 'main1', 110)
+        self._build(run2, 'main2', 200)
+        self._build(run2, 'extra1', 300)
+        self.assertEqual(self._metrics.last_run(), run2)
+        self.assertEqual(self._metrics.slowest(run1, 2), [
+            ('main1', 100, 50, 1024),
+            ('main2', 50, 25, 1024),
+        ])
+        # extra1 failed on the first run
+        self.assertEqual(self._metrics.regressions(run2), [('main2', 50, 200)])
+        self.assertEqual(self._metrics.regressions(run1), [])
+        run3 = self._metrics.start_run(1.5)
+        self._build(run3, 'main1', 1000, 1)
+        self._build(run3, 'extra1', 600)
+        self.assertEqual(self._metrics.regressions(run3), [('extra1', 300, 600)])
+    
+    def test_lock_wait_column(self):
+        filename = os.path.join(self._tempdir, 'metrics.sqlite')
+        db = sqlite3.connect(filename)
+        db.execute('''
+            CREATE TABLE builds (
+                run_id INTEGER, package TEXT, version TEXT,
+                return_code INTEGER, wall REAL, cpu REAL, max_rss INTEGER,
+                ebuild REAL, manifest REAL, package_manager REAL
+            )''')
+        db.commit()
+        db.close()
+        self._metrics = tinderbox.Metrics(filename)
+        run_id = self._metrics.start_run(1.5)
+        self._build(run_id, 'main1', 100)
+        self.assertEqual(self._metrics.db.execute(
+            'SELECT wall, lock_wait FROM builds').fetchall(), [(100, 5)])
+    
+    def test_measured_portage(self):
+        pkg_manager = tinderbox.MeasuredPortage()
+        pkg_manager._fullcommand = [sys.executable, '-c']
+        code = 'import sys; x = " " * (50 * 1024 * 1024); sys.exit(3)'
+        self.assertEqual(pkg_manager.run_command([code]), 3)
+        self.assertTrue(pkg_manager.last.max_rss >= 50 * 1024)
+        self.assertTrue(pkg_manager.last.cpu >= 0)
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(TestScheduler('test_run'))
+    suite.addTest(TestScheduler('test_built'))
+    suite.addTest(TestFingerprints('test_propagation'))
+    suite.addTest(TestFingerprints('test_cached'))
+    suite.addTest(TestBuilder('test_force'))
+    suite.addTest(TestTrac('test_read_log'))
+    suite.addTest(TestTrac('test_report'))
+    suite.addTest(TestTrac('test_retry'))
+    suite.addTest(TestTrac('test_lost_response'))
+    suite.addTest(TestTrac('test_reporter'))
+    suite.addTest(TestMetrics('test_metrics'))
+    suite.addTest(TestMetrics('test_lock_wait_column'))
+    suite.addTest(TestMetrics('test_measured_portage'))
+    return suite